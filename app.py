@@ -2,16 +2,33 @@ import os
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from google import genai
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from dataclasses import dataclass
 import json
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import re
+import asyncio
+from contextlib import asynccontextmanager
 from helpers.ds1 import chat_with_agent_ds1
-from helpers.ds2 import chat_with_agent_ds2
-from helpers.general_helpers import UserIntentDS2, get_intent_ds2, clean_sql, contains_code
-from typing import Optional, List
+from helpers.ds2 import chat_with_agent_ds2, start_speculative_sql_ds2
+from helpers.general_helpers import UserIntentDS2, get_intent_ds2, clean_sql, contains_code, emit
+from helpers.history import compact_history, format_history_for_gemini
+from helpers.warmup import warm_up, WARMUP_CONFIG
+from helpers.chart_encoding import encode_chart_columnar
+from helpers.sql_cache import sql_cache, result_cache, normalize_question
+from helpers.speculation import speculation_stats
+from helpers.model_router import choose_model, track_route, route_stats
+from helpers.clients import supabase, gemini_client, pool_stats
+from helpers.jobs import submit_job, get_job, wait_for_job, job_status
+from typing import Optional, List, Dict, Any, Union, Literal
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # import torch
 
@@ -23,28 +40,43 @@ class CONFIG:
     SUPABASE_KEY = os.getenv("SUPABASE_KEY")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     ENVIRONMENT_TYPE = os.getenv("ENVIRONMENT_TYPE")
+    # Responses smaller than this are not worth compressing
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
     # OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
     # HUGGING_FACE_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
     # MODEL_PATH = "flan_t5_sql"
     # DEVICE = torch.device("cpu")
     # HF_MODEL_ID = "rprkh/t5_flan"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_CONFIG.ON_STARTUP:
+        await asyncio.to_thread(warm_up, force=True)
+    yield
+
 app = FastAPI(
     title="EvolveNXT AI Agent",
-    redirect_slashes=False
+    redirect_slashes=False,
+    lifespan=lifespan
 )
 
+ALLOWED_ORIGINS = ["http://127.0.0.1:3000", "http://localhost:3000", "https://evolvenxt-frontend.vercel.app"]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://127.0.0.1:3000", "http://localhost:3000", "https://evolvenxt-frontend.vercel.app"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Brotli when the client accepts it, gzip otherwise
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=CONFIG.COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=CONFIG.COMPRESSION_MIN_SIZE)
+
 
-supabase: Client = create_client(CONFIG.SUPABASE_URL, CONFIG.SUPABASE_KEY)
-gemini_client = genai.Client(api_key=CONFIG.GEMINI_API_KEY)
 # client = InferenceClient(model=CONFIG.HF_MODEL_ID, token=os.getenv("HUGGING_FACE_API_KEY"))
 
 query_cache = {}
@@ -53,6 +85,11 @@ class ChatResponse(BaseModel):
     response: str
     show_buttons: Optional[bool] = False
     buttons: Optional[List[str]] = None
+    type: Literal["text", "chart"] = "text"
+    chart_type: Optional[Literal["line", "bar", "pie"]] = None
+    # "rows": [{"period": ..., "<series>": ...}, ...], "columnar": see encode_chart_columnar
+    chart_encoding: Optional[Literal["rows", "columnar"]] = None
+    chart_data: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = None
 
 class Message(BaseModel):
     role: str
@@ -62,16 +99,60 @@ class ChatRequest(BaseModel):
     message: str
     dataset: Optional[str] = None   # selected agent (DS-1, DS-2, TARS)
     history: Optional[List[Message]] = None
+    chart_encoding: Literal["rows", "columnar"] = "rows"
+
+def build_agent_response(agent_result, fallback: str, chart_encoding: str = "rows") -> dict:
+    """Agents return plain text, or a chart payload dict for GENERATE_CHART requests."""
+    if isinstance(agent_result, dict) and agent_result.get("type") == "chart":
+        chart_data = agent_result["chart_data"]
+        if chart_encoding == "columnar":
+            chart_data = encode_chart_columnar(chart_data)
+
+        return {
+            "response": agent_result["content"],
+            "type": "chart",
+            "chart_type": agent_result["chart_type"],
+            "chart_encoding": chart_encoding,
+            "chart_data": chart_data
+        }
+
+    return {"response": agent_result or fallback}
+
+def run_dataset_agent(dataset: str, message: str, chart_encoding: str = "rows", on_event=None) -> dict:
+    if dataset == "DS-1":
+        return build_agent_response(
+            chat_with_agent_ds1(message, on_event=on_event),
+            "The DS-1 agent was unable to accurately process your request. Please try rephrasing your question.",
+            chart_encoding
+        )
+
+    return build_agent_response(chat_with_agent_ds2(message, on_event=on_event), "No response from DS-2 agent.", chart_encoding)
 
 @app.get("/application_initialization")
 def application_initialization():
     if not supabase or not gemini_client:
         return {"message": "Initialization failed", "success": False}
-        
+
+    warmup_report = warm_up()
+    step_succeeded = lambda prefix: any(
+        step["success"] for step in warmup_report["steps"] if step["step"].startswith(prefix)
+    )
+
     return {
         "message": "Application initialized successfully",
-        "supabase_connected": True,
-        "gemini_client_initialized": True
+        "supabase_connected": step_succeeded("run_sql_probe"),
+        "gemini_client_initialized": step_succeeded("gemini_connect"),
+        "warmup": warmup_report
+    }
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "speculation": speculation_stats.snapshot(),
+        "model_routes": route_stats.snapshot(),
+        "connection_pools": pool_stats(),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": result_cache.stats()
     }
 
 @app.get("/")
@@ -111,13 +192,83 @@ def get_user_intent(message: str) -> str:
     return data.get("dataset_choice", "NONE")
 
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    user_input = req.message.strip()
-    dataset = req.dataset
-    last_selection = False
-    history_messages = req.history or []
+def handle_ds2_message(user_input: str, state: dict, chart_encoding: str = "rows", on_event=None) -> dict:
+    """DS-2 turn including the Consolidate / Upline Manager follow-up. `state` holds that follow-up between turns."""
+    if user_input.lower() in ["consolidate", "upline manager"]:
+        original_query = state.get("last_commission_query", "agent commissions")
+        
+        if user_input.lower() == "consolidate":
+            modified_query = f"{original_query} and {user_input.lower()} them"
+            response_text = chat_with_agent_ds2(modified_query, on_event=on_event)
+            state.pop("last_commission_query", None)
+            return build_agent_response(response_text, "No response from DS-2 agent.", chart_encoding)
+        
+        elif user_input.lower() == "upline manager":
+            state["waiting_for_manager"] = True
+            return {"response": "Please provide the name or ID of the upline manager."}
+    
+    if state.get("waiting_for_manager"):
+        original_query = state.get("last_commission_query", "agent commissions")
+        modified_query = f"{original_query} for upline manager {user_input}"
+        response_text = chat_with_agent_ds2(modified_query, on_event=on_event)
+        state.pop("last_commission_query", None)
+        state.pop("waiting_for_manager", None)
+        return build_agent_response(response_text, "No response from DS-2 agent.", chart_encoding)
+    
+    speculative_sql = start_speculative_sql_ds2(user_input)
+    intent = get_intent_ds2(user_input)
+    if intent.sub_intent == "AGENT_COMMISSIONS":
+        if speculative_sql is not None:
+            speculative_sql.discard()
+        state["last_commission_query"] = user_input
+        return {
+            "response": "How would you like to view agent commissions?",
+            "show_buttons": True,
+            "buttons": ["Consolidate", "Upline Manager"]
+        }
+    
+    response_text = chat_with_agent_ds2(user_input, intent_data=intent, speculative_sql=speculative_sql, on_event=on_event)
+    return build_agent_response(response_text, "No response from DS-2 agent.", chart_encoding)
+
+def chat_with_tars(user_input: str, history_messages, on_event=None) -> dict:
+    history_summary, recent_messages = compact_history(history_messages)
+    formatted_history = format_history_for_gemini(recent_messages)
 
+    print(f"TARS history: {len(history_messages)} messages, {len(recent_messages)} kept verbatim, summary: {history_summary is not None}")
+
+    system_instruction = """
+        Your name is TARS. You are a helpful AI assistant for general questions.
+        - You can answer general queries about any topic.
+        - For questions related to sales, commissions, bonuses, age, ID, tiers, orders, validity, or other dataset-specific queries, instruct the user to use the dropdown and select the appropriate dataset agent (DS-1 or DS-2).
+    """
+
+    if history_summary:
+        system_instruction += f"\n    Summary of the earlier part of this conversation:\n    {history_summary}\n"
+
+    try:
+        chat_model = choose_model("chat")
+        with track_route("TARS", "chat", chat_model):
+            chat_session = gemini_client.chats.create(
+                model=chat_model,
+                history=formatted_history,
+                config={"system_instruction": system_instruction}
+            )
+
+            if on_event is None:
+                response = chat_session.send_message(user_input)
+                return {"response": response.text}
+
+            # Streaming callers get the answer as it is generated
+            response_text = ""
+            for chunk in chat_session.send_message_stream(user_input):
+                if chunk.text:
+                    response_text += chunk.text
+                    emit(on_event, "text_delta", text=chunk.text)
+            return {"response": response_text}
+    except:
+        return {"response": "TARS was unable to understand your question. Please try again with another prompt or selec a specific agent from the dropdown to get information related to the datasets"}
+
+def handle_chat_message(user_input: str, dataset: str, history_messages, state: dict, chart_encoding: str = "rows", on_event=None) -> dict:
     if contains_code(user_input):
         return {"response": "I'm sorry, I cannot process requests containing code snippets for security reasons."}
 
@@ -126,67 +277,186 @@ def chat(req: ChatRequest):
 
 
     if dataset == "DS-1":
-        response_text = chat_with_agent_ds1(user_input)
-        return {"response": response_text or "The DS-1 agent was unable to accurately process your request. Please try rephrasing your question."}
+        return run_dataset_agent(dataset, user_input, chart_encoding, on_event)
 
     if dataset == "DS-2":
-        if user_input.lower() in ["consolidate", "upline manager"]:
-            original_query = query_cache.get("last_commission_query", "agent commissions")
-            
-            if user_input.lower() == "consolidate":
-                modified_query = f"{original_query} and {user_input.lower()} them"
-                response_text = chat_with_agent_ds2(modified_query)
-                query_cache.pop("last_commission_query", None)
-                return {"response": response_text or "No response from DS-2 agent."}
-            
-            elif user_input.lower() == "upline manager":
-                query_cache["waiting_for_manager"] = True
-                return {"response": "Please provide the name or ID of the upline manager."}
-        
-        if query_cache.get("waiting_for_manager"):
-            original_query = query_cache.get("last_commission_query", "agent commissions")
-            modified_query = f"{original_query} for upline manager {user_input}"
-            response_text = chat_with_agent_ds2(modified_query)
-            query_cache.pop("last_commission_query", None)
-            query_cache.pop("waiting_for_manager", None)
-            return {"response": response_text or "No response from DS-2 agent."}
-        
-        intent = get_intent_ds2(user_input)
-        if intent.sub_intent == "AGENT_COMMISSIONS":
-            query_cache["last_commission_query"] = user_input
-            return {
-                "response": "How would you like to view agent commissions?",
-                "show_buttons": True,
-                "buttons": ["Consolidate", "Upline Manager"]
-            }
-        
-        response_text = chat_with_agent_ds2(user_input)
-        return {"response": response_text or "No response from DS-2 agent."}
+        return handle_ds2_message(user_input, state, chart_encoding, on_event)
+
+    return chat_with_tars(user_input, history_messages, on_event)
 
-    if dataset not in ["DS-1", "DS-2"]:
+@app.post("/chat", response_model=ChatResponse)
+def chat(req: ChatRequest):
+    return handle_chat_message(
+        req.message.strip(),
+        req.dataset,
+        req.history or [],
+        query_cache,
+        req.chart_encoding
+    )
 
-        formatted_history = [
-            {"role": "user" if m.role == "user" else "model", "parts": [{"text": m.content}]}
-            for m in history_messages
-        ]
 
-        print(f"User chat history with TARS: {formatted_history}")
+class JobResponse(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "done", "failed"]
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
-        system_instruction = """
-            Your name is TARS. You are a helpful AI assistant for general questions.
-            - You can answer general queries about any topic.
-            - For questions related to sales, commissions, bonuses, age, ID, tiers, orders, validity, or other dataset-specific queries, instruct the user to use the dropdown and select the appropriate dataset agent (DS-1 or DS-2).
-        """
+# Upper bounds so a poll or push connection never holds a worker forever
+MAX_JOB_WAIT_SECONDS = 25
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
 
-        try:
-            chat_session = gemini_client.chats.create(
-                model="gemini-2.0-flash",
-                history=formatted_history,
-                config={"system_instruction": system_instruction}
-            )
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+def submit_chat_job(req: ChatRequest):
+    """Run a DS-1/DS-2 request in the background and return its job id straight away."""
+    user_input = req.message.strip()
 
-            response = chat_session.send_message(user_input)
-            return {"response": response.text}
-        except:
-            return {"response": "TARS was unable to understand your question. Please try again with another prompt or selec a specific agent from the dropdown to get information related to the datasets"}
-        
+    if contains_code(user_input):
+        raise HTTPException(status_code=400, detail="I'm sorry, I cannot process requests containing code snippets for security reasons.")
+
+    if req.dataset not in ["DS-1", "DS-2"]:
+        raise HTTPException(status_code=400, detail="Background jobs are only available for the DS-1 and DS-2 agents.")
+
+    job_key = (req.dataset, normalize_question(user_input), req.chart_encoding)
+    job = submit_job(job_key, run_dataset_agent, req.dataset, user_input, req.chart_encoding)
+
+    return job_status(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_chat_job(job_id: str, wait: float = 0):
+    """Poll a job. `wait` long-polls for up to MAX_JOB_WAIT_SECONDS until the job finishes."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or its result has expired.")
+
+    if wait > 0:
+        await wait_for_job(job, min(wait, MAX_JOB_WAIT_SECONDS))
+
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_chat_job(job_id: str):
+    """Server-sent events: keep-alive comments while the job runs, then one event with the result."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or its result has expired.")
+
+    async def events():
+        while not await wait_for_job(job, JOB_EVENTS_KEEPALIVE_SECONDS):
+            yield ": keep-alive\n\n"
+
+        payload = JobResponse(**job_status(job)).model_dump_json()
+        yield f"event: {job['status']}\ndata: {payload}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+class SocketMessage(BaseModel):
+    message: str
+    # Only needed when the user switches agent, the session remembers the last one
+    dataset: Optional[str] = None
+    chart_encoding: Optional[Literal["rows", "columnar"]] = None
+
+# Rows sent in a "rows" event, the session keeps all of them
+WS_ROWS_PREVIEW = 50
+WS_MAX_HISTORY_MESSAGES = 200
+
+def new_chat_session() -> dict:
+    return {
+        "dataset": None,
+        "chart_encoding": "rows",
+        "history": [],
+        # Consolidate / Upline Manager follow-up for DS-2
+        "state": {},
+        "last_sql": None,
+        "last_rows": None
+    }
+
+def handle_socket_message(session: dict, incoming: SocketMessage, on_event) -> dict:
+    if incoming.dataset is not None:
+        session["dataset"] = incoming.dataset
+    if incoming.chart_encoding is not None:
+        session["chart_encoding"] = incoming.chart_encoding
+
+    def record_event(event: str, data: dict):
+        if event == "sql":
+            session["last_sql"] = data["query"]
+        elif event == "rows":
+            rows = data["rows"]
+            session["last_rows"] = rows
+            data = {"row_count": len(rows) if rows else 0, "rows": (rows or [])[:WS_ROWS_PREVIEW]}
+        on_event(event, data)
+
+    user_input = incoming.message.strip()
+    response = handle_chat_message(
+        user_input,
+        session["dataset"],
+        session["history"],
+        session["state"],
+        session["chart_encoding"],
+        record_event
+    )
+
+    session["history"].append({"role": "user", "content": user_input})
+    session["history"].append({"role": "model", "content": response["response"]})
+    del session["history"][:-WS_MAX_HISTORY_MESSAGES]
+
+    return response
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    Persistent chat channel. The server keeps the dataset, history, last SQL/rows and the
+    DS-2 follow-up state per connection, so each message only carries the new text.
+    Client -> {"message": ..., "dataset"?: ..., "chart_encoding"?: ...}
+    Server -> {"event": "intent" | "sql" | "rows" | "text_delta", ...} while working,
+              then {"event": "response", "data": ChatResponse} or {"event": "error", "detail": ...}
+    """
+    origin = websocket.headers.get("origin")
+    if origin and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    session = new_chat_session()
+    loop = asyncio.get_running_loop()
+
+    async def send(payload: dict):
+        await websocket.send_json(payload)
+
+    try:
+        while True:
+            try:
+                incoming = SocketMessage.model_validate_json(await websocket.receive_text())
+            except ValidationError as error:
+                await send({"event": "error", "detail": str(error)})
+                continue
+
+            queue = asyncio.Queue()
+            on_event = lambda event, data: loop.call_soon_threadsafe(queue.put_nowait, ("event", {"event": event, **data}))
+
+            def work():
+                try:
+                    response = handle_socket_message(session, incoming, on_event)
+                    loop.call_soon_threadsafe(queue.put_nowait, ("done", response))
+                except Exception as error:
+                    print(f"WebSocket chat error: {error}")
+                    loop.call_soon_threadsafe(queue.put_nowait, ("error", str(error)))
+
+            # Agents are synchronous, run them off the event loop and forward progress as it arrives
+            loop.run_in_executor(None, work)
+
+            while True:
+                kind, payload = await queue.get()
+                if kind == "event":
+                    await send(payload)
+                elif kind == "done":
+                    await send({"event": "response", "data": ChatResponse(**payload).model_dump()})
+                    break
+                else:
+                    await send({"event": "error", "detail": payload})
+                    break
+    except WebSocketDisconnect:
+        print("WebSocket chat session closed")
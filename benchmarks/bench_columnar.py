@@ -0,0 +1,98 @@
+"""
+Row vs columnar run_sql results: payload size, decode time and decode + chart formatting time.
+
+    python benchmarks/bench_columnar.py [--rows 1000 10000 100000] [--repeat 5]
+
+Rows are synthetic fact_commissions rows (daily commissions per agent), which is
+the shape of the large GENERATE_CHART results. The chart step is the DS-2 line
+chart formatter, fed rows or a ColumnarResult the way the chart path is.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# helpers.ds2 creates the shared clients on import, they only need well formed settings
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from helpers.columnar import rows_to_columnar, decode_columnar
+from helpers.ds2 import format_data_for_line_or_bar_chart
+
+
+def make_rows(count: int) -> list:
+    random.seed(7)
+    agents = [(f"A{i:04d}", f"Agent {i}", f"M{i % 25:03d}", f"Manager {i % 25}", f"Agency {i % 7}") for i in range(200)]
+    start = date(2022, 1, 1)
+
+    rows = []
+    for idx in range(count):
+        agent_id, agent_name, upline_id, upline_manager, agency_name = agents[idx % len(agents)]
+        day = start + timedelta(days=idx // len(agents))
+        rows.append({
+            "id": idx + 1,
+            "agent_id": agent_id,
+            "agent_name": agent_name,
+            "upline_id": upline_id,
+            "upline_manager": upline_manager,
+            "agency_name": agency_name,
+            "commission_date": day.isoformat(),
+            "commission_year": day.year,
+            "commission_month": day.month,
+            "commission_quarter": f"Q{(day.month - 1) // 3 + 1}_{day.year}",
+            "commission_amount": round(random.uniform(10, 5000), 2)
+        })
+
+    return rows
+
+
+def decode_rows(body: bytes):
+    return json.loads(body)
+
+
+def decode_columns(body: bytes):
+    return decode_columnar(json.loads(body))
+
+
+def best_of(fn, body: bytes, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(body)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    header = f"{'rows':>8} {'format':>9} {'bytes':>11} {'gzip':>10} {'decode ms':>10} {'+chart ms':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for count in args.rows:
+        rows = make_rows(count)
+        row_body = json.dumps(rows).encode()
+        column_body = json.dumps(rows_to_columnar(rows)).encode()
+
+        row_ms = best_of(decode_rows, row_body, args.repeat) * 1000
+        row_chart_ms = best_of(lambda body: format_data_for_line_or_bar_chart(decode_rows(body)), row_body, args.repeat) * 1000
+        column_ms = best_of(decode_columns, column_body, args.repeat) * 1000
+        column_chart_ms = best_of(lambda body: format_data_for_line_or_bar_chart(decode_columns(body)), column_body, args.repeat) * 1000
+
+        print(f"{count:>8} {'rows':>9} {len(row_body):>11,} {len(gzip.compress(row_body)):>10,} {row_ms:>10.1f} {row_chart_ms:>10.1f}")
+        print(f"{count:>8} {'columnar':>9} {len(column_body):>11,} {len(gzip.compress(column_body)):>10,} {column_ms:>10.1f} {column_chart_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from typing import Any, Dict, List
+
+INDEX_KEYS = ("period", "name")
+
+
+def encode_chart_columnar(chart_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert chart rows ([{"period": "2022", "Avery": 1.0, ...}, ...]) into one
+    array per series:
+        {"index_key": "period", "index": ["2022", ...], "series": {"Avery": [1.0, ...]}}
+    Periods where a series has no value get None.
+    """
+    if not chart_data:
+        return {"index_key": None, "index": [], "series": {}}
+
+    index_key = next((k for k in INDEX_KEYS if k in chart_data[0]), None)
+    index = [row.get(index_key) for row in chart_data] if index_key else list(range(len(chart_data)))
+
+    series: Dict[str, List[Any]] = {}
+    for position, row in enumerate(chart_data):
+        for key, value in row.items():
+            if key == index_key:
+                continue
+            if key not in series:
+                series[key] = [None] * len(chart_data)
+            series[key][position] = value
+
+    return {"index_key": index_key, "index": index, "series": series}
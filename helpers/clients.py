@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+import httpx
+from dotenv import load_dotenv
+from supabase import create_client, Client, ClientOptions
+from google import genai
+from google.genai import types
+
+load_dotenv()
+
+@dataclass
+class TRANSPORT_CONFIG:
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    HTTP2 = os.getenv("HTTP_POOL_HTTP2", "true").lower() in ("1", "true", "yes")
+    MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "50"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+    KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+    READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "60"))
+    POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", "10"))
+
+request_counts = Counter()
+request_counts_lock = threading.Lock()
+
+
+def _count_request(name: str):
+    def hook(request):
+        with request_counts_lock:
+            request_counts[name] += 1
+    return hook
+
+
+def create_http_client(name: str) -> httpx.Client:
+    """
+    Every upstream gets its own client built from the same pool settings.
+    Supabase sets its base URL and API key headers on the client it is given,
+    so sharing one client with Gemini would leak those headers to Google.
+    """
+    return httpx.Client(
+        http2=TRANSPORT_CONFIG.HTTP2,
+        limits=httpx.Limits(
+            max_connections=TRANSPORT_CONFIG.MAX_CONNECTIONS,
+            max_keepalive_connections=TRANSPORT_CONFIG.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=TRANSPORT_CONFIG.KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            TRANSPORT_CONFIG.READ_TIMEOUT,
+            connect=TRANSPORT_CONFIG.CONNECT_TIMEOUT,
+            pool=TRANSPORT_CONFIG.POOL_TIMEOUT
+        ),
+        event_hooks={"request": [_count_request(name)]}
+    )
+
+
+http_clients = {
+    "supabase": create_http_client("supabase"),
+    "gemini": create_http_client("gemini")
+}
+
+# The only Supabase and Gemini clients in the application, shared by app.py and every agent
+supabase: Client = create_client(
+    TRANSPORT_CONFIG.SUPABASE_URL,
+    TRANSPORT_CONFIG.SUPABASE_KEY,
+    options=ClientOptions(httpx_client=http_clients["supabase"])
+)
+gemini_client = genai.Client(
+    api_key=TRANSPORT_CONFIG.GEMINI_API_KEY,
+    http_options=types.HttpOptions(
+        httpx_client=http_clients["gemini"],
+        # Milliseconds, otherwise the SDK sends requests without any timeout
+        timeout=int(TRANSPORT_CONFIG.READ_TIMEOUT * 1000)
+    )
+)
+
+
+def pool_stats() -> dict:
+    """Connection pool usage per upstream, for sizing the pool against our concurrency."""
+    stats = {}
+    for name, client in http_clients.items():
+        # httpx does not expose the pool publicly, so read httpcore's pool defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+
+        with request_counts_lock:
+            requests_sent = request_counts[name]
+
+        stats[name] = {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "active": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+            "requests_sent": requests_sent,
+            "max_connections": TRANSPORT_CONFIG.MAX_CONNECTIONS,
+            "max_keepalive_connections": TRANSPORT_CONFIG.MAX_KEEPALIVE_CONNECTIONS
+        }
+
+    return stats
@@ -0,0 +1,148 @@
+import math
+from array import array
+from typing import Any, Dict, List
+
+# run_sql_columnar payload:
+# {
+#     "columns": [{"name": "agent_name", "type": "string"}, {"name": "commission_amount", "type": "number"}],
+#     "row_count": 2,
+#     "data": [["Avery", "Jordan"], [120.5, 98.0]]
+# }
+# Types are JSON types as reported by Postgres json_typeof: number, string, boolean, or null when
+# every value in the column is null.
+
+NUMERIC = "number"
+# PostgREST error code for a function that does not exist
+FUNCTION_NOT_FOUND = "PGRST202"
+
+
+class ColumnarResult:
+    """
+    Decoded run_sql_columnar result. Numeric columns are stored as array('d') with
+    NaN for nulls, every other column as a plain list.
+    """
+
+    def __init__(self, names: List[str], types: List[str], columns: Dict[str, Any], row_count: int, integer_columns=()):
+        self.names = names
+        self.types = dict(zip(names, types))
+        self.columns = columns
+        self.row_count = row_count
+        # Numeric columns whose values were all integers, so they decode back to int
+        self.integer_columns = set(integer_columns)
+
+    def __repr__(self):
+        return f"ColumnarResult(row_count={self.row_count}, columns={self.names})"
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return [name for name in self.names if self.types[name] == NUMERIC]
+
+    def value(self, name: str, idx: int):
+        """One value with nulls restored to None, without materializing the column."""
+        value = self.columns[name][idx]
+        if self.types[name] != NUMERIC:
+            return value
+        if math.isnan(value):
+            return None
+        return int(value) if name in self.integer_columns else value
+
+    def column(self, name: str) -> list:
+        """Values of one column with nulls restored to None."""
+        values = self.columns[name]
+        if self.types[name] != NUMERIC:
+            return list(values)
+        if name in self.integer_columns:
+            return [None if math.isnan(v) else int(v) for v in values]
+        return [None if math.isnan(v) else v for v in values]
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """The row format run_sql returns, for code that still expects a list of dicts."""
+        columns = [self.column(name) for name in self.names]
+        return [dict(zip(self.names, values)) for values in zip(*columns)]
+
+    def to_dataframe(self):
+        import numpy as np
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                # Zero copy view over the typed array
+                name: np.frombuffer(self.columns[name], dtype="float64") if self.types[name] == NUMERIC else self.columns[name]
+                for name in self.names
+            },
+            columns=self.names
+        )
+
+
+def _json_type(values) -> str:
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "boolean"
+        if isinstance(value, (int, float)):
+            return NUMERIC
+        return "string"
+    return "null"
+
+
+def rows_to_columnar(rows: List[Dict[str, Any]]) -> dict:
+    """
+    Encode run_sql rows in the run_sql_columnar format. Used as the local stand-in
+    while the database function is not deployed, and by the benchmark.
+    """
+    rows = rows or []
+    names = list(rows[0].keys()) if rows else []
+    data = [[row.get(name) for row in rows] for name in names]
+
+    return {
+        "columns": [{"name": name, "type": _json_type(values)} for name, values in zip(names, data)],
+        "row_count": len(rows),
+        "data": data
+    }
+
+
+def decode_columnar(payload: dict) -> ColumnarResult:
+    payload = payload or {"columns": [], "row_count": 0, "data": []}
+    names = [column["name"] for column in payload["columns"]]
+    types = [column["type"] for column in payload["columns"]]
+
+    columns = {}
+    integer_columns = []
+    for name, column_type, values in zip(names, types, payload["data"]):
+        if column_type == NUMERIC:
+            columns[name] = array("d", [math.nan if v is None else v for v in values])
+            if all(v is None or isinstance(v, int) for v in values):
+                integer_columns.append(name)
+        else:
+            columns[name] = values
+
+    row_count = payload.get("row_count", len(payload["data"][0]) if payload["data"] else 0)
+    return ColumnarResult(names, types, columns, row_count, integer_columns)
+
+
+def as_columnar(data) -> ColumnarResult:
+    """The chart formatters take either run_sql rows or a ColumnarResult."""
+    if isinstance(data, ColumnarResult):
+        return data
+    return decode_columnar(rows_to_columnar(data))
+
+
+columnar_function_missing = False
+
+
+def fetch_columnar(supabase, query: str) -> ColumnarResult:
+    global columnar_function_missing
+
+    if not columnar_function_missing:
+        try:
+            payload = supabase.rpc("run_sql_columnar", {"query": query}).execute().data
+            return decode_columnar(payload)
+        except Exception as error:
+            if getattr(error, "code", None) != FUNCTION_NOT_FOUND:
+                raise
+            print("run_sql_columnar is not deployed, falling back to run_sql")
+            columnar_function_missing = True
+
+    # Encode the row result locally so callers always get the same format
+    return decode_columnar(rows_to_columnar(supabase.rpc("run_sql", {"query": query}).execute().data))
@@ -1,4 +1,5 @@
 import os
+import math
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from google import genai
@@ -11,7 +12,13 @@ import traceback
 import re
 from typing import Literal
 import re
-from .general_helpers import get_intent, clean_sql
+from .general_helpers import get_intent, clean_sql, emit
+from .clients import supabase, gemini_client
+from .sql_cache import CACHE_CONFIG, sql_cache, normalize_question, run_sql, run_sql_columnar
+from .columnar import ColumnarResult, as_columnar
+from .entity_index import EntityIndex, with_correction_note
+from .speculation import speculate, take_or_run, record_usage
+from .model_router import ROUTER_CONFIG, choose_model, track_route, run_sql_with_escalation
 
 load_dotenv()
 
@@ -22,12 +29,15 @@ class CONFIG:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     ENVIRONMENT_TYPE = os.getenv("ENVIRONMENT_TYPE")
 
-supabase: Client = create_client(CONFIG.SUPABASE_URL, CONFIG.SUPABASE_KEY)
-gemini_client = genai.Client(api_key=CONFIG.GEMINI_API_KEY)
+entity_index = EntityIndex(
+    {"salesperson": "select distinct name as value from salesperson"},
+    supabase
+)
 
 
 def format_data_for_line_or_bar_chart(rows, chart_type="line"):
-    if not rows:
+    data = as_columnar(rows)
+    if not data.row_count:
         return []
 
     EXCLUDE_KEYS = {'id', 'agent_id', 'upline_id'}
@@ -43,90 +53,81 @@ def format_data_for_line_or_bar_chart(rows, chart_type="line"):
         'salesperson_name'
     ]
 
-    time_key = next((c for c in time_columns if c in rows[0]), None)
-    name_key = next((c for c in name_columns if c in rows[0]), None)
+    time_key = next((c for c in time_columns if c in data.types), None)
+    name_key = next((c for c in name_columns if c in data.types), None)
+
+    # Column types come with the result, so numbers are found per column instead of probing every value
+    numeric_keys = [k for k in data.numeric_columns if k not in EXCLUDE_KEYS]
 
 
     if chart_type == "bar":
         result = []
 
-        numeric_keys = [
-            k for k, v in rows[0].items()
-            if k not in EXCLUDE_KEYS and isinstance(v, (int, float))
-        ]
+        # The value column is the first one with a number in the first row
+        value_key = next((k for k in numeric_keys if not math.isnan(data.columns[k][0])), None)
 
         # Fallback: no numeric column detected
-        if not numeric_keys:
+        if value_key is None:
             return []
+        string_keys = [k for k in data.names if data.types[k] == "string"]
 
-        value_key = numeric_keys[0]
-
-        for row in rows:
+        for idx in range(data.row_count):
             label = (
-                row.get(name_key)
-                or row.get(time_key)
-                or next((str(v) for v in row.values() if isinstance(v, str)), "Item")
+                (data.value(name_key, idx) if name_key else None)
+                or (data.value(time_key, idx) if time_key else None)
+                or next((data.value(k, idx) for k in string_keys if data.value(k, idx) is not None), "Item")
             )
 
             result.append({
                 "name": str(label),
-                "value": float(row.get(value_key, 0) or 0)
+                "value": float(data.value(value_key, idx) or 0)
             })
 
         return result
 
     # line chart
     grouped = {}
-    valid_time_key = time_key is not None
-
-    for idx, row in enumerate(rows):
-        # Fallback period index if no time column
-        period = (
-            str(row.get(time_key))
-            if valid_time_key
-            else str(idx)
-        )
+    periods = [str(v) for v in data.column(time_key)] if time_key else [str(idx) for idx in range(data.row_count)]
+    series_names = data.column(name_key) if name_key else [None] * data.row_count
+    series_columns = [(key, data.columns[key]) for key in numeric_keys]
 
+    for idx, period in enumerate(periods):
         if period not in grouped:
             grouped[period] = {"period": period}
 
-        series_name = row.get(name_key)
+        series_name = series_names[idx]
 
         numeric_found = False
 
-        for key, value in row.items():
-            if key in EXCLUDE_KEYS:
+        for key, values in series_columns:
+            numeric_value = values[idx]
+            if math.isnan(numeric_value):
                 continue
+            numeric_found = True
 
-            try:
-                numeric_value = float(value)
-                numeric_found = True
+            # Prefer named series, else use key
+            series_label = (
+                str(series_name)
+                if series_name
+                else key
+            )
 
-                # Prefer named series, else use key
-                series_label = (
-                    str(series_name)
-                    if series_name
-                    else key
-                )
-
-                grouped[period][series_label] = numeric_value
-            except (ValueError, TypeError):
-                continue
+            grouped[period][series_label] = numeric_value
 
         # Ultimate fallback: plot entire row as key-value
         if not numeric_found:
-            for key, value in row.items():
-                try:
-                    grouped[period][key] = float(value)
-                except (ValueError, TypeError):
-                    continue
+            for key in data.numeric_columns:
+                numeric_value = data.columns[key][idx]
+                if not math.isnan(numeric_value):
+                    grouped[period][key] = numeric_value
 
     return sorted(grouped.values(), key=lambda x: x["period"])
 
 
 
 def format_data_for_pie_chart(rows):
-    if not rows:
+    data = as_columnar(rows)
+    if not data.row_count:
         return []
 
     EXCLUDE_KEYS = {'id', 'agent_id', 'upline_id'}
@@ -134,54 +135,46 @@ def format_data_for_pie_chart(rows):
     name_columns = ["name", "salesperson", "sales_year", "year", "order_year", "validity"]
     value_columns = ["total_valid_sales", "bonus", "total_sales", "amount", "bonus_amount", "order_count"]
 
-    name_key = next((c for c in name_columns if c in rows[0]), None)
-    value_key = next((c for c in value_columns if c in rows[0]), None)
+    name_key = next((c for c in name_columns if c in data.types), None)
+    value_key = next((c for c in value_columns if c in data.types), None)
+    numeric_keys = [k for k in data.numeric_columns if k not in EXCLUDE_KEYS]
 
     result = []
 
     # Normal (name + value detected)
     if name_key and value_key:
-        for row in rows:
+        for idx in range(data.row_count):
             result.append({
-                "name": str(row.get(name_key, "Unknown")),
-                "value": float(row.get(value_key, 0) or 0)
+                "name": str(data.value(name_key, idx)),
+                "value": float(data.value(value_key, idx) or 0)
             })
         return result
 
     # Fallback path 1: one row, many numeric columns
-    if len(rows) == 1:
-        row = rows[0]
-        for key, value in row.items():
-            if key in EXCLUDE_KEYS:
-                continue
-            try:
+    if data.row_count == 1:
+        for key in numeric_keys:
+            numeric_value = data.columns[key][0]
+            if not math.isnan(numeric_value):
                 result.append({
                     "name": key,
-                    "value": float(value)
+                    "value": numeric_value
                 })
-            except (ValueError, TypeError):
-                continue
 
         return result
 
     # Fallback path 2: multiple rows, no clear schema
-    for idx, row in enumerate(rows):
+    for idx in range(data.row_count):
         label = (
-            row.get(name_key)
-            or row.get("name")
-            or row.get("salesperson")
+            (data.value(name_key, idx) if name_key else None)
+            or (data.value("name", idx) if "name" in data.types else None)
+            or (data.value("salesperson", idx) if "salesperson" in data.types else None)
             or f"Item {idx + 1}"
         )
 
-        numeric_value = None
-        for key, value in row.items():
-            if key in EXCLUDE_KEYS:
-                continue
-            try:
-                numeric_value = float(value)
-                break
-            except (ValueError, TypeError):
-                continue
+        numeric_value = next(
+            (data.columns[key][idx] for key in numeric_keys if not math.isnan(data.columns[key][idx])),
+            None
+        )
 
         if numeric_value is not None:
             result.append({
@@ -218,74 +211,111 @@ BONUS EDGE CASES:
 For generating charts based on sales, consider both 'valid' and 'invalid' sales unless otherwise specified by the user
 """
 
-def chat_with_agent_ds1(user_input):
+def generate_sql_ds1(question: str, usage: dict = None, model: str = None, use_cache: bool = True):
+    """
+    Returns (sql, model that generated it, cache key, resolved names). The SQL is only
+    cached by execute_sql_ds1 once it has run successfully.
+    """
+    resolved_question, resolved_names = entity_index.resolve(question)
+    if resolved_names:
+        print(f"Resolved names: {resolved_names}")
+
+    cache_key = ("DS-1", "sql", normalize_question(resolved_question))
+    if use_cache:
+        cached = sql_cache.get(cache_key)
+        if cached is not None:
+            print(f"SQL cache hit: {cached[0]}")
+            return (*cached, cache_key, resolved_names)
+
+    model = model or choose_model("sql", "DS-1", question, mentions_names=bool(resolved_names))
+
+    input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{resolved_question}\n\nReturn only the PostgreSQL query. Do not include explanations."
+    with track_route("DS-1", "sql_generation", model):
+        response = gemini_client.models.generate_content(
+            model=model,
+            contents=f"{input_to_model}",
+            config={
+                "temperature": 0.0
+            }
+        )
+    record_usage(usage, response)
+    print(f"Response from Gemini API ({model}): {response.text}")
+    clean_sql_query = clean_sql(response.text)
+
+    return clean_sql_query, model, cache_key, resolved_names
+
+def execute_sql_ds1(question: str, sql_and_model, on_event=None, columnar: bool = False):
+    """
+    Run the generated SQL, regenerating it with the stronger model if the cheap one's SQL fails.
+    With `columnar` the result is a ColumnarResult instead of rows.
+    """
+    generated_query, model, cache_key, _ = sql_and_model
+    execute = run_sql_columnar if columnar else run_sql
+    clean_sql_query, rows = run_sql_with_escalation(
+        "DS-1", question, generated_query, model,
+        regenerate=lambda strong_model: generate_sql_ds1(question, model=strong_model, use_cache=False)[0],
+        execute=lambda query: execute(supabase, query)
+    )
+    if rows is not None:
+        # Only SQL that ran is reused, a failed query would otherwise be served until it expires
+        sql_cache.set(cache_key, (clean_sql_query, model if clean_sql_query == generated_query else ROUTER_CONFIG.STRONG_MODEL))
+    emit(on_event, "sql", query=clean_sql_query)
+    if on_event is not None:
+        emit(on_event, "rows", rows=rows.to_rows() if isinstance(rows, ColumnarResult) else rows)
+
+    return clean_sql_query, rows
+
+def chat_with_agent_ds1(user_input, on_event=None):
     question = user_input
 
+    # QUERY_DATA and GENERATE_CHART use the same SQL prompt, so start generating
+    # it while the intent is being classified
+    speculative_sql = speculate(None, generate_sql_ds1, question)
+
     intent_data = get_intent(question)
     print(f"User intent: {intent_data}")
+    emit(on_event, "intent", intent=intent_data.intent, chart_type=intent_data.chart_type)
 
     if intent_data.intent == "QUERY_DATA":
         try:
-            input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{question}\n\nReturn only the PostgreSQL query. Do not include explanations."
             print(f"Use question: {question}")
-            response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=f"{input_to_model}",
-                config={
-                    "temperature": 0.0
-                }
-            )
-            print(f"Response from Gemini API: {response.text}")
-            clean_sql_query = clean_sql(response.text)
-
-            supabase_response = supabase.rpc(
-                "run_sql",
-                {"query": clean_sql_query}
-            ).execute()
-            print(supabase_response.data)
-
-            final_response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=f"Question:{question}\n\nSQL Query:{clean_sql_query}\n\nResult from the SQL query execution:{supabase_response.data}\n\nGenerate a concise and clear answer to the question based on the SQL query result. If the question cannot be answered based on the result, say 'The data does not provide an answer to this question.'",
-                config={
-                    "temperature": 0.0
-                }
-            )
+            sql_and_model = take_or_run(speculative_sql, None, lambda: generate_sql_ds1(question))
+
+            clean_sql_query, rows = execute_sql_ds1(question, sql_and_model, on_event)
+            print(rows)
+
+            summary_model = choose_model("summary", "DS-1", question)
+            with track_route("DS-1", "summary", summary_model):
+                final_response = gemini_client.models.generate_content(
+                    model=summary_model,
+                    contents=f"Question:{question}\n\nSQL Query:{clean_sql_query}\n\nResult from the SQL query execution:{rows}\n\nGenerate a concise and clear answer to the question based on the SQL query result. If the question cannot be answered based on the result, say 'The data does not provide an answer to this question.'",
+                    config={
+                        "temperature": 0.0
+                    }
+                )
 
-            return final_response.text
+            return with_correction_note(final_response.text, sql_and_model[3])
         except:
             return "Your request was unable to be processed. Please try again with a different prompt."
     elif intent_data.intent == "GENERATE_CHART":
         try:            
-            input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{question}\n\nReturn only the PostgreSQL query. Do not include explanations."
             print(f"Use question: {question}")
-            response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=f"{input_to_model}",
-                config={
-                    "temperature": 0.0
-                }
-            )
-            print(f"Response from Gemini API: {response.text}")
-            clean_sql_query = clean_sql(response.text)
+            sql_and_model = take_or_run(speculative_sql, None, lambda: generate_sql_ds1(question))
 
-            supabase_response = supabase.rpc(
-                "run_sql",
-                {"query": clean_sql_query}
-            ).execute()
-            print(supabase_response.data)
+            clean_sql_query, rows = execute_sql_ds1(question, sql_and_model, on_event, columnar=CACHE_CONFIG.RESULT_FORMAT == "columnar")
+            print(rows)
 
-            if supabase_response.data == None:
+            if rows == None:
                 return "The model was unable to generate a chart for this request from the database. Please try again."
 
             chart_type = intent_data.chart_type or "line"
 
             if chart_type == "pie":
-                formatted_chart_data = format_data_for_pie_chart(supabase_response.data)
+                formatted_chart_data = format_data_for_pie_chart(rows)
             elif chart_type == "bar":
-                formatted_chart_data = format_data_for_line_or_bar_chart(supabase_response.data)
+                formatted_chart_data = format_data_for_line_or_bar_chart(rows)
             else:
-                formatted_chart_data = format_data_for_line_or_bar_chart(supabase_response.data)
+                formatted_chart_data = format_data_for_line_or_bar_chart(rows)
 
             print(formatted_chart_data)
 
@@ -294,23 +324,28 @@ def chat_with_agent_ds1(user_input):
 
             chart_payload = {
                 "type": "chart",
-                "content": f"I've generated a {chart_type} chart based on your request.",
+                "content": with_correction_note(f"I've generated a {chart_type} chart based on your request.", sql_and_model[3]),
                 "chart_data": formatted_chart_data,
                 "chart_type": chart_type
             }
-            return json.dumps(chart_payload)
+            return chart_payload
         # except Exception as error:
         except:
             # traceback.print_exc()
             return "Please rephrase your question to be more specific about the chart you want to generate."
             
     else:
+        if speculative_sql is not None:
+            speculative_sql.discard()
+
         try:
-            chat_session = gemini_client.chats.create(
-                model="gemini-2.0-flash",
-                config={"system_instruction": "Your name is DS-1. You are a PostgreSQL expert."}
-            )
-            general_chat_response = chat_session.send_message(user_input)
+            chat_model = choose_model("chat")
+            with track_route("DS-1", "chat", chat_model):
+                chat_session = gemini_client.chats.create(
+                    model=chat_model,
+                    config={"system_instruction": "Your name is DS-1. You are a PostgreSQL expert."}
+                )
+                general_chat_response = chat_session.send_message(user_input)
 
             return general_chat_response.text
         except:
@@ -1,11 +1,18 @@
 import os
+import math
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from google import genai
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dataclasses import dataclass
-from .general_helpers import get_intent_ds2, clean_sql
+from .general_helpers import UserIntentDS2, get_intent_ds2, clean_sql, emit
+from .clients import supabase, gemini_client
+from .sql_cache import CACHE_CONFIG, sql_cache, normalize_question, run_sql, run_sql_columnar
+from .columnar import NUMERIC, ColumnarResult, as_columnar
+from .entity_index import EntityIndex, with_correction_note
+from .speculation import speculate, take_or_run, record_usage
+from .model_router import ROUTER_CONFIG, choose_model, track_route, run_sql_with_escalation
 import json
 import traceback
 
@@ -18,8 +25,14 @@ class CONFIG:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     ENVIRONMENT_TYPE = os.getenv("ENVIRONMENT_TYPE")
 
-supabase: Client = create_client(CONFIG.SUPABASE_URL, CONFIG.SUPABASE_KEY)
-gemini_client = genai.Client(api_key=CONFIG.GEMINI_API_KEY)
+entity_index = EntityIndex(
+    {
+        "agent_name": "select distinct agent_name as value from fact_commissions",
+        "upline_manager": "select distinct upline_manager as value from fact_commissions",
+        "agency_name": "select distinct agency_name as value from fact_commissions"
+    },
+    supabase
+)
 
 table_schema = """
 Table: fact_commissions
@@ -46,7 +59,8 @@ Generate valid PostgreSQL queries based on the fact_commissions table schema. Th
 """
 
 def format_data_for_line_or_bar_chart(rows):
-    if not rows:
+    data = as_columnar(rows)
+    if not data.row_count:
         return []
 
     time_columns = [
@@ -61,24 +75,27 @@ def format_data_for_line_or_bar_chart(rows):
     ]
     EXCLUDE_KEYS = {'id', 'agent_id', 'upline_id'}
 
-    time_key = next((c for c in time_columns if c in rows[0]), None)
+    time_key = next((c for c in time_columns if c in data.types), None)
+    name_keys = [c for c in name_columns if c in data.types]
 
-    grouped = {}
+    # Column types come with the result, so numbers are found per column instead of probing every value
+    series_columns = [
+        (key, data.columns[key]) for key in data.numeric_columns
+        if key not in EXCLUDE_KEYS and key != time_key
+    ]
+    periods = [str(v) for v in data.column(time_key)] if time_key else [f"row_{idx}" for idx in range(data.row_count)]
 
-    for idx, row in enumerate(rows):
-        period = str(row.get(time_key)) if time_key else f"row_{idx}"
+    grouped = {}
 
+    for idx, period in enumerate(periods):
         if period not in grouped:
             grouped[period] = {"period": period}
 
-        name = next((row[col] for col in name_columns if col in row and row[col]), None)
+        name = next((data.value(col, idx) for col in name_keys if data.value(col, idx)), None)
 
-        for key, value in row.items():
-            if key in EXCLUDE_KEYS or key == time_key:
-                continue
-            try:
-                numeric_value = float(value)
-            except (ValueError, TypeError):
+        for key, values in series_columns:
+            numeric_value = values[idx]
+            if math.isnan(numeric_value):
                 continue
 
             if name:
@@ -88,13 +105,11 @@ def format_data_for_line_or_bar_chart(rows):
 
         # include all key-value pairs
         if len(grouped[period]) == 1:
-            for key, value in row.items():
+            for key in data.names:
                 if key in EXCLUDE_KEYS:
                     continue
-                try:
-                    grouped[period][key] = float(value)
-                except (ValueError, TypeError):
-                    grouped[period][key] = str(value)
+                value = data.value(key, idx)
+                grouped[period][key] = float(value) if data.types[key] == NUMERIC and value is not None else str(value)
 
     try:
         return sorted(grouped.values(), key=lambda x: x["period"])
@@ -103,7 +118,8 @@ def format_data_for_line_or_bar_chart(rows):
 
 
 def format_data_for_pie_chart(rows):
-    if not rows:
+    data = as_columnar(rows)
+    if not data.row_count:
         return []
 
     name_columns = ['agent_name', 'upline_manager', 'agency_name', 'name', 'salesperson', 'year']
@@ -113,90 +129,154 @@ def format_data_for_pie_chart(rows):
         'total_commission', 'total_commissions', 'bonus', 'amount', 'total_sales'
     ]
 
-    name_key = next((col for col in name_columns if col in rows[0]), None)
-    value_key = next((col for col in value_columns if col in rows[0]), None)
+    name_key = next((col for col in name_columns if col in data.types), None)
+    value_key = next((col for col in value_columns if col in data.types), None)
 
     if not name_key or not value_key:
-        for key, value in rows[0].items():
-            if not name_key and isinstance(value, str) and key not in ['id', 'agent_id', 'upline_id', 'commission_date', 'commission_quarter']:
+        for key in data.names:
+            first = data.value(key, 0)
+            if not name_key and data.types[key] == "string" and first is not None and key not in ['id', 'agent_id', 'upline_id', 'commission_date', 'commission_quarter']:
                 name_key = key
-            elif not value_key and isinstance(value, (int, float)):
+            elif not value_key and data.types[key] == NUMERIC and first is not None:
                 value_key = key
 
     result = []
-    for row in rows:
+    if not name_key or not value_key:
+        for idx in range(data.row_count):
+            for key in data.names:
+                if key in ['id', 'agent_id', 'upline_id']:
+                    continue
+                value = data.value(key, idx)
+                result.append({
+                    "name": str(key),
+                    "value": float(value) if data.types[key] == NUMERIC and value is not None else 0
+                })
+        return result
+
+    for idx in range(data.row_count):
         try:
-            if not name_key or not value_key:
-                for key, value in row.items():
-                    if key in ['id', 'agent_id', 'upline_id']:
-                        continue
-                    result.append({
-                        "name": str(key),
-                        "value": float(value) if isinstance(value, (int, float)) else 0
-                    })
-                continue
-
             result.append({
-                "name": str(row.get(name_key, 'Unknown')),
-                "value": float(row.get(value_key, 0) or 0)
+                "name": str(data.value(name_key, idx)),
+                "value": float(data.value(value_key, idx) or 0)
             })
         except (ValueError, TypeError):
             continue
 
     return result
 
-def chat_with_agent_ds2(user_input: str):
-    intent_data = get_intent_ds2(user_input)
+def generate_sql_ds2(question: str, for_chart: bool = False, usage: dict = None, model: str = None, use_cache: bool = True):
+    """
+    Returns (sql, model that generated it, cache key, resolved names). The SQL is only
+    cached by execute_sql_ds2 once it has run successfully.
+    """
+    resolved_question, resolved_names = entity_index.resolve(question)
+    if resolved_names:
+        print(f"DS-2 resolved names: {resolved_names}")
+
+    cache_key = ("DS-2", "chart" if for_chart else "sql", normalize_question(resolved_question))
+    if use_cache:
+        cached = sql_cache.get(cache_key)
+        if cached is not None:
+            print(f"DS-2 SQL cache hit: {cached[0]}")
+            return (*cached, cache_key, resolved_names)
+
+    model = model or choose_model("sql", "DS-2", question, mentions_names=bool(resolved_names))
+
+    # Chart queries must keep the original column names so the chart formatters can find them
+    column_rule = " Do not change the column names from the original table." if for_chart else ""
+    input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{resolved_question}\n\nReturn only the PostgreSQL query.{column_rule} Do not include explanations."
+
+    with track_route("DS-2", "sql_generation", model):
+        response = gemini_client.models.generate_content(
+            model=model,
+            contents=input_to_model,
+            config={"temperature": 0.0}
+        )
+    record_usage(usage, response)
+
+    clean_sql_query = clean_sql(response.text)
+
+    return clean_sql_query, model, cache_key, resolved_names
+
+def execute_sql_ds2(question: str, sql_and_model, for_chart: bool = False, on_event=None, columnar: bool = False):
+    """
+    Run the generated SQL, regenerating it with the stronger model if the cheap one's SQL fails.
+    With `columnar` the result is a ColumnarResult instead of rows.
+    """
+    generated_query, model, cache_key, _ = sql_and_model
+    execute = run_sql_columnar if columnar else run_sql
+    clean_sql_query, rows = run_sql_with_escalation(
+        "DS-2", question, generated_query, model,
+        regenerate=lambda strong_model: generate_sql_ds2(question, for_chart=for_chart, model=strong_model, use_cache=False)[0],
+        execute=lambda query: execute(supabase, query)
+    )
+    if rows is not None:
+        # Only SQL that ran is reused, a failed query would otherwise be served until it expires
+        sql_cache.set(cache_key, (clean_sql_query, model if clean_sql_query == generated_query else ROUTER_CONFIG.STRONG_MODEL))
+    emit(on_event, "sql", query=clean_sql_query)
+    if on_event is not None:
+        emit(on_event, "rows", rows=rows.to_rows() if isinstance(rows, ColumnarResult) else rows)
+
+    return clean_sql_query, rows
+
+# Same keywords as the hard constraint in get_intent_ds2
+CHART_KEYWORDS = ["chart", "graph", "plot", "bar", "line", "pie", "visualize", "visualisation", "show as", "display as"]
+
+def looks_like_chart_request(question: str) -> bool:
+    lowered = question.lower()
+    return any(keyword in lowered for keyword in CHART_KEYWORDS)
+
+def start_speculative_sql_ds2(question: str):
+    """Start generating SQL with the prompt the intent is most likely to need."""
+    for_chart = looks_like_chart_request(question)
+    return speculate(for_chart, generate_sql_ds2, question, for_chart=for_chart)
+
+def chat_with_agent_ds2(user_input: str, intent_data: UserIntentDS2 = None, speculative_sql=None, on_event=None):
+    if intent_data is None:
+        speculative_sql = speculative_sql or start_speculative_sql_ds2(user_input)
+        intent_data = get_intent_ds2(user_input)
     print(f"Intent data: {intent_data}")
+    emit(on_event, "intent", intent=intent_data.intent, chart_type=intent_data.chart_type)
 
     if intent_data.intent == "QUERY_DATA":
         question = user_input
 
-        input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{question}\n\nReturn only the PostgreSQL query. Do not include explanations."
-
         print(f"DS-2 question: {question}")
 
         try:
-            response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=input_to_model,
-                config={"temperature": 0.0}
-            )
-
-            clean_sql_query = clean_sql(response.text)
-            print(f"DS-2 SQL query: {clean_sql_query}")
-
-            supabase_response = supabase.rpc(
-                "run_sql",
-                {"query": clean_sql_query}
-            ).execute()
-            print(f"Supabase response: {supabase_response.data}")
-
-            number_of_rows_returned_by_sql_query = len(supabase_response.data)
+            sql_and_model = take_or_run(speculative_sql, False, lambda: generate_sql_ds2(question))
+            print(f"DS-2 SQL query: {sql_and_model[0]}")
+
+            clean_sql_query, rows = execute_sql_ds2(question, sql_and_model, on_event=on_event)
+            print(f"Supabase response: {rows}")
+
+            number_of_rows_returned_by_sql_query = len(rows)
             print(f"No of rows returned by the SQL query from Supabase: {number_of_rows_returned_by_sql_query}")
 
             if number_of_rows_returned_by_sql_query > 6:
-                if isinstance(supabase_response.data, list) and len(supabase_response.data) > 0:
+                if isinstance(rows, list) and len(rows) > 0:
                     formatted_string = ""
                     
-                    for item in supabase_response.data:
+                    for item in rows:
                         for key, value in item.items():
                             formatted_string += f"{key}: {value}\n"
                         formatted_string += "\n"
                     
-                    return formatted_string.strip()
+                    return with_correction_note(formatted_string.strip(), sql_and_model[3])
                 else:
                     return "No data found."
             else:
-                final_response = gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=f"Question:{question}\n\nSQL Query:{clean_sql_query}\n\nResult from the SQL query execution:{supabase_response.data}\n\nGenerate a concise and clear answer to the question based on the SQL query result. If the question cannot be answered based on the result, say 'The data does not provide an answer to this question.'",
-                    config={
-                        "temperature": 0.0
-                    }
-                )
-
-                return final_response.text
+                summary_model = choose_model("summary", "DS-2", question)
+                with track_route("DS-2", "summary", summary_model):
+                    final_response = gemini_client.models.generate_content(
+                        model=summary_model,
+                        contents=f"Question:{question}\n\nSQL Query:{clean_sql_query}\n\nResult from the SQL query execution:{rows}\n\nGenerate a concise and clear answer to the question based on the SQL query result. If the question cannot be answered based on the result, say 'The data does not provide an answer to this question.'",
+                        config={
+                            "temperature": 0.0
+                        }
+                    )
+
+                return with_correction_note(final_response.text, sql_and_model[3])
 
         except:
             return "Your request was unable to be processed. Please try again with a different prompt."
@@ -205,35 +285,24 @@ def chat_with_agent_ds2(user_input: str):
         question = user_input
         chart_type = intent_data.chart_type or "line"  # Default to line
 
-        input_to_model = f"You are a PostgreSQL expert.\n\nSchema:{table_schema}\n\nRelationships:{relationships}\n\nImportant points to consider while generating PostgreSQL queries:{important_points}\n\nQuestion:{question}\n\nReturn only the PostgreSQL query. Do not change the column names from the original table. Do not include explanations."
-
         print(f"DS-2 chart question: {question}")
         print(f"Chart type: {chart_type}")
 
         try:
-            response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=input_to_model,
-                config={"temperature": 0.0}
-            )
-
-            clean_sql_query = clean_sql(response.text)
-            print(f"DS-2 chart SQL query: {clean_sql_query}")
+            sql_and_model = take_or_run(speculative_sql, True, lambda: generate_sql_ds2(question, for_chart=True))
+            print(f"DS-2 chart SQL query: {sql_and_model[0]}")
 
-            supabase_response = supabase.rpc(
-                "run_sql",
-                {"query": clean_sql_query}
-            ).execute()
-            print(f"DS-2 chart data: {supabase_response.data}")
+            clean_sql_query, rows = execute_sql_ds2(question, sql_and_model, for_chart=True, on_event=on_event, columnar=CACHE_CONFIG.RESULT_FORMAT == "columnar")
+            print(f"DS-2 chart data: {rows}")
 
             if chart_type == "pie":
-                formatted_chart_data = format_data_for_pie_chart(supabase_response.data)
+                formatted_chart_data = format_data_for_pie_chart(rows)
             else:
-                formatted_chart_data = format_data_for_line_or_bar_chart(supabase_response.data)
+                formatted_chart_data = format_data_for_line_or_bar_chart(rows)
             
             print(f"Formatted chart data: {formatted_chart_data}")
 
-            if supabase_response.data == None:
+            if rows == None:
                 return "The model was unable to generate a chart for this request from the database. Please try again."
 
             if not formatted_chart_data:
@@ -241,23 +310,28 @@ def chat_with_agent_ds2(user_input: str):
 
             chart_payload = {
                 "type": "chart",
-                "content": f"I've generated a {chart_type} chart based on your request.",
+                "content": with_correction_note(f"I've generated a {chart_type} chart based on your request.", sql_and_model[3]),
                 "chart_data": formatted_chart_data,
                 "chart_type": chart_type
             }
-            return json.dumps(chart_payload)
+            return chart_payload
 
         except:
             print(f"Chart generation error")
             
             return "Please rephrase your question to be more specific about the chart you want to generate."
     else:
+        if speculative_sql is not None:
+            speculative_sql.discard()
+
         try:
-            chat_session = gemini_client.chats.create(
-                model="gemini-2.0-flash",
-                config={"system_instruction": "Your name is DS-2. You are a PostgreSQL expert."}
-            )
-            general_chat_response = chat_session.send_message(user_input)
+            chat_model = choose_model("chat")
+            with track_route("DS-2", "chat", chat_model):
+                chat_session = gemini_client.chats.create(
+                    model=chat_model,
+                    config={"system_instruction": "Your name is DS-2. You are a PostgreSQL expert."}
+                )
+                general_chat_response = chat_session.send_message(user_input)
 
             return general_chat_response.text
         except:
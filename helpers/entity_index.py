@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import Dict, List, Optional, Tuple
+from .sql_cache import run_sql
+
+load_dotenv()
+
+@dataclass
+class ENTITY_INDEX_CONFIG:
+    REFRESH_SECONDS = float(os.getenv("ENTITY_INDEX_REFRESH_SECONDS", "600"))
+    # Wait this long after a failed refresh before trying again
+    RETRY_SECONDS = float(os.getenv("ENTITY_INDEX_RETRY_SECONDS", "30"))
+    # Minimum Dice similarity between trigram sets for a fuzzy match
+    MIN_SCORE = float(os.getenv("ENTITY_INDEX_MIN_SCORE", "0.6"))
+    MIN_FUZZY_LENGTH = 5
+    # Shorter / longer length of a fuzzy match, keeps "August" from matching "Augustine"
+    MIN_LENGTH_RATIO = 0.8
+    # Only the names sharing the most trigrams are checked with edit distance
+    MAX_EDIT_CANDIDATES = 20
+
+# Words that appear in questions all the time and must never be "corrected" into a name
+COMMON_WORDS = {
+    "agent", "agents", "agency", "agencies", "amount", "average", "bonus", "bonuses", "by",
+    "chart", "commission", "commissions", "compare", "date", "display", "each", "every",
+    "for", "from", "graph", "how", "line", "manager", "managers", "many", "month",
+    "monthly", "much", "order", "orders", "over", "quarter", "sales", "salesperson",
+    "show", "tier", "tiers", "total", "training", "upline", "valid", "invalid", "what",
+    "which", "who", "with", "year", "yearly", "their", "there", "these", "those",
+    "a", "an", "and", "as", "at", "did", "do", "does", "get", "give", "in", "is", "list",
+    "me", "of", "on", "or", "per", "the", "to", "under", "was", "were",
+    "best", "count", "data", "number", "sell", "sold", "top", "worst"
+}
+
+# Date words are only ever matched exactly, "March" is a month and not a misspelled "Marcy"
+DATE_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug",
+    "sep", "sept", "oct", "nov", "dec",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "mon", "tue", "tues", "wed", "thu", "thur", "thurs", "fri", "sat", "sun",
+    "today", "yesterday", "tomorrow", "day", "days", "daily", "week", "weeks", "weekly",
+    "weekend", "months", "years", "quarters", "quarterly", "annual", "annually",
+    "since", "until", "before", "after", "during", "last", "next", "this", "previous",
+    "current", "ytd", "mtd", "qtd", "fiscal"
+}
+
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'.-]*")
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Optimal string alignment distance, counts a swap of two adjacent letters as one edit."""
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+
+    return previous[-1]
+
+
+def _comparable(candidate: str, name: str) -> bool:
+    """
+    Guard for fuzzy matches. A word that is a truncation of a name is a different word,
+    and one with another first letter is usually another name ("Jason" is not a typo of "Mason").
+    """
+    if candidate[0] != name[0]:
+        return False
+    shorter, longer = sorted((candidate, name), key=len)
+    if len(shorter) / len(longer) < ENTITY_INDEX_CONFIG.MIN_LENGTH_RATIO:
+        return False
+    return not (len(shorter) < len(longer) and longer.startswith(shorter))
+
+
+class EntityIndex:
+    """
+    In-memory trigram index of the distinct names in the dataset tables, used to
+    map misspelled names in a question to the exact spelling stored in the database.
+    `sources` maps a field label to a query returning the distinct values as `value`.
+    """
+
+    def __init__(self, sources: Dict[str, str], supabase):
+        self.sources = sources
+        self.supabase = supabase
+        self.loaded_at = None
+        self.failed_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._set_names({})
+
+    def _set_names(self, names_by_field: Dict[str, List[str]]):
+        names = []
+        exact = {}
+        postings = defaultdict(list)
+        span_sizes = set()
+
+        for field, values in names_by_field.items():
+            for value in values:
+                name_id = len(names)
+                grams = trigrams(value)
+                names.append((value, field, len(grams)))
+                exact.setdefault(value.lower(), name_id)
+                span_sizes.add(len(WORD_PATTERN.findall(value)))
+                for gram in grams:
+                    postings[gram].append(name_id)
+
+        # Swap everything in at once so readers never see a half built index
+        self._names, self._exact, self._postings = names, exact, dict(postings)
+        self._span_sizes = sorted(span_sizes, reverse=True)
+
+    def refresh(self):
+        names_by_field = {}
+        for field, query in self.sources.items():
+            rows = run_sql(self.supabase, query, use_cache=False) or []
+            names_by_field[field] = sorted({
+                str(row["value"]).strip() for row in rows if row.get("value")
+            })
+
+        self._set_names(names_by_field)
+        self.loaded_at = time.monotonic()
+        print(f"Entity index refreshed: {len(self._names)} names")
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+            self.failed_at = None
+        except Exception as error:
+            self.failed_at = time.monotonic()
+            print(f"Entity index refresh failed: {error}")
+        finally:
+            self._refreshing = False
+
+    def ensure_fresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < ENTITY_INDEX_CONFIG.REFRESH_SECONDS:
+            return
+        # Without this every question would block on the database again while it is down
+        if self.failed_at is not None and time.monotonic() - self.failed_at < ENTITY_INDEX_CONFIG.RETRY_SECONDS:
+            return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        if not self._names:
+            # Nothing to resolve against yet, the first load has to block
+            self._refresh_in_background()
+        else:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def lookup(self, candidate: str) -> Optional[Tuple[str, str, float]]:
+        """Returns (canonical name, field, score) for the best match, or None."""
+        name_id = self._exact.get(candidate.lower())
+        if name_id is not None:
+            value, field, _ = self._names[name_id]
+            return value, field, 1.0
+
+        if len(candidate) < ENTITY_INDEX_CONFIG.MIN_FUZZY_LENGTH:
+            return None
+        if any(word.lower() in DATE_WORDS for word in WORD_PATTERN.findall(candidate)):
+            return None
+
+        grams = trigrams(candidate)
+        shared = defaultdict(int)
+        for gram in grams:
+            for match_id in self._postings.get(gram, ()):
+                shared[match_id] += 1
+
+        lowered = candidate.lower()
+        max_edits = 1 if len(candidate) < 8 else 2
+        top = sorted(shared.items(), key=lambda item: item[1], reverse=True)[:ENTITY_INDEX_CONFIG.MAX_EDIT_CANDIDATES]
+
+        best = None
+        for match_id, count in top:
+            value, field, gram_count = self._names[match_id]
+            if not _comparable(lowered, value.lower()):
+                continue
+            score = 2 * count / (len(grams) + gram_count)
+
+            # Trigrams are weak on short names ("Alcie" vs "Alice"), fall back to edit distance
+            if score < ENTITY_INDEX_CONFIG.MIN_SCORE and abs(len(value) - len(candidate)) <= max_edits:
+                distance = edit_distance(lowered, value.lower())
+                if distance <= max_edits:
+                    score = max(score, 1 - distance / max(len(value), len(candidate)))
+
+            if score >= ENTITY_INDEX_CONFIG.MIN_SCORE and (best is None or score > best[2]):
+                best = (value, field, score)
+
+        return best
+
+    def resolve(self, question: str) -> Tuple[str, list]:
+        """
+        Replace names in the question with their canonical spelling.
+        Returns the rewritten question and the list of (original, canonical, field, score).
+        """
+        self.ensure_fresh()
+        if not self._names:
+            return question, []
+
+        words = list(WORD_PATTERN.finditer(question))
+        resolutions = []
+        replacements = []
+        idx = 0
+
+        while idx < len(words):
+            matched = False
+            # Longest span first so "Avery Rodriguez" wins over "Avery"
+            for size in self._span_sizes:
+                span = words[idx:idx + size]
+                if len(span) < size:
+                    continue
+                # A name never starts or ends with a filler word ("for avery")
+                if span[0].group().lower() in COMMON_WORDS or span[-1].group().lower() in COMMON_WORDS:
+                    continue
+                # A single lowercase word is an ordinary word ("spring and autumn"), only
+                # full names ("avery rodriguez") are looked up without a capital letter
+                if size == 1 and not span[0].group()[0].isupper():
+                    continue
+
+                start, end = span[0].start(), span[-1].end()
+                # Match the name without a possessive so "Alise's" becomes "Alice's"
+                if question[start:end].lower().endswith("'s"):
+                    end -= 2
+                candidate = question[start:end]
+                match = self.lookup(candidate)
+                if match is None:
+                    continue
+
+                canonical, field, score = match
+                if canonical != candidate:
+                    replacements.append((start, end, canonical))
+                resolutions.append((candidate, canonical, field, round(score, 3)))
+                idx += size
+                matched = True
+                break
+
+            if not matched:
+                idx += 1
+
+        for start, end, canonical in reversed(replacements):
+            question = question[:start] + canonical + question[end:]
+
+        return question, resolutions
+
+
+def with_correction_note(text: str, resolutions: list) -> str:
+    """Prefix an answer with the names that were read as a different name, so a wrong guess is visible."""
+    corrections = [
+        f'{canonical} instead of "{original}"'
+        for original, canonical, _, _ in resolutions if original.lower() != canonical.lower()
+    ]
+    if not corrections:
+        return text
+    return f"Showing results for {', '.join(corrections)}.\n\n{text}"
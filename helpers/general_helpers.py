@@ -10,6 +10,8 @@ from pydantic import BaseModel
 import re
 from typing import Literal, Optional
 import re
+from .model_router import choose_model, track_route
+from .clients import gemini_client
 
 @dataclass
 class CONFIG:
@@ -40,14 +42,16 @@ def get_intent(user_input):
     - GENERAL_CHAT: Greeting or off-topic.
     """
     
-    response = gemini_client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": UserIntent,
-        }
-    )
+    intent_model = choose_model("intent")
+    with track_route("DS-1", "intent", intent_model):
+        response = gemini_client.models.generate_content(
+            model=intent_model,
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": UserIntent,
+            }
+        )
     return UserIntent.model_validate_json(response.text)
 
 def clean_sql(text: str) -> str:
@@ -56,8 +60,6 @@ def clean_sql(text: str) -> str:
 
     return text.strip()
 
-gemini_client = genai.Client(api_key=CONFIG.GEMINI_API_KEY)
-
 
 class UserIntentDS2(BaseModel):
     intent: Literal["QUERY_DATA", "GENERATE_CHART", "GENERAL_CHAT"]
@@ -125,16 +127,27 @@ def get_intent_ds2(user_input: str) -> UserIntentDS2:
         Return ONLY valid JSON that matches the UserIntentDS2 schema.
     """
 
-    response = gemini_client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": UserIntentDS2,
-        }
-    )
+    intent_model = choose_model("intent")
+    with track_route("DS-2", "intent", intent_model):
+        response = gemini_client.models.generate_content(
+            model=intent_model,
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": UserIntentDS2,
+            }
+        )
     return UserIntentDS2.model_validate_json(response.text)
 
+def emit(on_event, event: str, **data):
+    """Report pipeline progress to a streaming caller (the WebSocket channel). No-op for plain HTTP."""
+    if on_event is None:
+        return
+    try:
+        on_event(event, data)
+    except Exception as error:
+        print(f"Could not emit {event} event: {error}")
+
 def contains_code(text):
     code_patterns = [r"<script.*?>", r"import\s+.*", r"def\s+\w+\(.*\):", r"SELECT\s+.*\s+FROM"]
 
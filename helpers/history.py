@@ -0,0 +1,185 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import List, Optional, Tuple
+from .clients import gemini_client
+
+load_dotenv()
+
+@dataclass
+class HISTORY_CONFIG:
+    # Rough token budget for the history that is sent verbatim to Gemini
+    TOKEN_BUDGET = int(os.getenv("TARS_HISTORY_TOKEN_BUDGET", "2000"))
+    # Always keep at least this many of the most recent messages verbatim
+    MIN_RECENT_MESSAGES = int(os.getenv("TARS_HISTORY_MIN_RECENT", "4"))
+    # The summary boundary only moves in steps of this many messages so the
+    # rolling summary is not recomputed on every single turn
+    SUMMARY_CHUNK = int(os.getenv("TARS_HISTORY_SUMMARY_CHUNK", "4"))
+    SUMMARY_MODEL = os.getenv("TARS_HISTORY_SUMMARY_MODEL", "gemini-2.0-flash")
+    SUMMARY_CACHE_SIZE = int(os.getenv("TARS_HISTORY_SUMMARY_CACHE_SIZE", "512"))
+    CHARS_PER_TOKEN = 4
+
+# prefix hash -> summary of every message in that prefix
+summary_cache: "OrderedDict[str, str]" = OrderedDict()
+summary_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    # Cheap heuristic, avoids a count_tokens round trip to Gemini on every turn
+    return len(text) // HISTORY_CONFIG.CHARS_PER_TOKEN + 1
+
+
+def _role(message) -> str:
+    role = message["role"] if isinstance(message, dict) else message.role
+    return "user" if role == "user" else "model"
+
+
+def _content(message) -> str:
+    return message["content"] if isinstance(message, dict) else message.content
+
+
+def prefix_hashes(history) -> List[str]:
+    """Chained hashes, hashes[i] identifies the prefix history[:i]."""
+    hashes = [hashlib.sha256(b"").hexdigest()]
+    for message in history:
+        digest = hashlib.sha256()
+        digest.update(hashes[-1].encode())
+        digest.update(_role(message).encode())
+        digest.update(b"\x00")
+        digest.update(_content(message).encode())
+        hashes.append(digest.hexdigest())
+
+    return hashes
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with summary_cache_lock:
+        summary = summary_cache.get(key)
+        if summary is not None:
+            summary_cache.move_to_end(key)
+        return summary
+
+
+def _cache_put(key: str, summary: str):
+    with summary_cache_lock:
+        summary_cache[key] = summary
+        summary_cache.move_to_end(key)
+        while len(summary_cache) > HISTORY_CONFIG.SUMMARY_CACHE_SIZE:
+            summary_cache.popitem(last=False)
+
+
+def find_split_index(history) -> int:
+    """Index of the first message that is kept verbatim."""
+    n = len(history)
+    if n <= HISTORY_CONFIG.MIN_RECENT_MESSAGES:
+        return 0
+
+    used = 0
+    split = n
+    for idx in range(n - 1, -1, -1):
+        cost = estimate_tokens(_content(history[idx]))
+        if n - idx > HISTORY_CONFIG.MIN_RECENT_MESSAGES and used + cost > HISTORY_CONFIG.TOKEN_BUDGET:
+            break
+        used += cost
+        split = idx
+
+    if split == 0:
+        return 0
+
+    # Snap up to a chunk boundary so the same prefix (and cached summary) is
+    # reused for several consecutive turns. Rounding up keeps the verbatim part
+    # inside the budget, it never drops below the minimum recent messages.
+    limit = n - HISTORY_CONFIG.MIN_RECENT_MESSAGES
+    chunk = max(HISTORY_CONFIG.SUMMARY_CHUNK, 1)
+    split = min(-(-split // chunk) * chunk, limit)
+
+    # Gemini expects the verbatim history to start with a user turn, prefer the
+    # next one and only keep an extra message when there is none before the limit
+    start = split
+    while split < limit and _role(history[split]) != "user":
+        split += 1
+    if split < n and _role(history[split]) != "user":
+        split = start
+        while split > 0 and _role(history[split]) != "user":
+            split -= 1
+
+    return split
+
+
+def summarize_messages(previous_summary: Optional[str], messages) -> str:
+    transcript = "\n".join(f"{_role(m)}: {_content(m)}" for m in messages)
+    previous = previous_summary or "(none)"
+
+    prompt = f"""
+    You maintain a running summary of a conversation between a user and TARS, an AI assistant.
+
+    Current summary:
+    {previous}
+
+    New messages to fold into the summary:
+    {transcript}
+
+    Return an updated summary in at most 200 words. Keep names, numbers, decisions
+    and open questions the user may refer back to. Do not add anything that was not said.
+    """
+
+    response = gemini_client.models.generate_content(
+        model=HISTORY_CONFIG.SUMMARY_MODEL,
+        contents=prompt,
+        config={"temperature": 0.0}
+    )
+    return response.text.strip()
+
+
+def get_summary(history, split: int, hashes: List[str]) -> Optional[str]:
+    if split == 0:
+        return None
+
+    cached = _cache_get(hashes[split])
+    if cached is not None:
+        return cached
+
+    # Roll forward from the longest prefix we already have a summary for
+    base = 0
+    previous_summary = None
+    for idx in range(split - 1, 0, -1):
+        previous_summary = _cache_get(hashes[idx])
+        if previous_summary is not None:
+            base = idx
+            break
+
+    summary = summarize_messages(previous_summary, history[base:split])
+    _cache_put(hashes[split], summary)
+
+    return summary
+
+
+def compact_history(history) -> Tuple[Optional[str], list]:
+    """
+    Split the conversation into a rolling summary of the older turns and the
+    most recent turns that fit in the token budget. Returns (summary, recent).
+    """
+    history = list(history or [])
+    split = find_split_index(history)
+    if split == 0:
+        return None, history
+
+    hashes = prefix_hashes(history[:split])
+    try:
+        summary = get_summary(history, split, hashes)
+    except Exception as error:
+        # Summarization is best effort, fall back to plain truncation
+        print(f"TARS history summarization failed: {error}")
+        summary = None
+
+    return summary, history[split:]
+
+
+def format_history_for_gemini(history) -> list:
+    return [
+        {"role": _role(m), "parts": [{"text": _content(m)}]}
+        for m in history
+    ]
@@ -0,0 +1,92 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from .sql_cache import TTLCache
+
+load_dotenv()
+
+@dataclass
+class JOBS_CONFIG:
+    MAX_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    # Finished results can be fetched by job id for this long
+    RESULT_TTL = float(os.getenv("JOB_RESULT_TTL_SECONDS", "900"))
+    MAX_JOBS = int(os.getenv("JOB_MAX_STORED", "1000"))
+    POLL_INTERVAL = 0.2
+
+executor = ThreadPoolExecutor(max_workers=JOBS_CONFIG.MAX_WORKERS, thread_name_prefix="job")
+
+# job id -> job record for queued and running jobs, these are never evicted
+active_jobs = {}
+# job id -> job record for finished jobs
+jobs = TTLCache(JOBS_CONFIG.RESULT_TTL, JOBS_CONFIG.MAX_JOBS)
+# request key -> queued or running job, an identical submission joins it instead of running again.
+# Finished jobs are not reused: agents turn backend errors into fallback text, so a "done" job
+# may hold a transient failure, and result freshness is left to the SQL and result caches.
+active_by_key = {}
+submit_lock = threading.Lock()
+
+
+def _run(job: dict, key, fn, args):
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    try:
+        job["result"] = fn(*args)
+        job["status"] = "done"
+    except Exception as error:
+        print(f"Job {job['job_id']} failed: {error}")
+        job["error"] = str(error)
+        job["status"] = "failed"
+    finally:
+        job["finished_at"] = time.time()
+        # Stored before it leaves active_jobs so lookups never miss it, expiry starts at completion
+        jobs.set(job["job_id"], job)
+        with submit_lock:
+            active_jobs.pop(job["job_id"], None)
+            if active_by_key.get(key) is job:
+                del active_by_key[key]
+        job["done"].set()
+
+
+def submit_job(key, fn, *args) -> dict:
+    """Run fn(*args) on the worker pool. Returns the job record, joining a queued or running job for the same key."""
+    with submit_lock:
+        existing = active_by_key.get(key)
+        if existing is not None:
+            return existing
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "done": threading.Event()
+        }
+        active_jobs[job["job_id"]] = job
+        active_by_key[key] = job
+
+    executor.submit(_run, job, key, fn, args)
+    return job
+
+
+def get_job(job_id: str):
+    return active_jobs.get(job_id) or jobs.get(job_id)
+
+
+async def wait_for_job(job: dict, timeout: float) -> bool:
+    """Wait on the event loop, a long poll must not hold one of the server's worker threads."""
+    deadline = time.monotonic() + timeout
+    while not job["done"].is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(JOBS_CONFIG.POLL_INTERVAL)
+    return job["done"].is_set()
+
+
+def job_status(job: dict) -> dict:
+    return {key: value for key, value in job.items() if key != "done"}
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import Optional
+from .sql_cache import TTLCache, normalize_question
+
+load_dotenv()
+
+@dataclass
+class ROUTER_CONFIG:
+    FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "gemini-2.0-flash")
+    STRONG_MODEL = os.getenv("ROUTER_STRONG_MODEL", "gemini-2.5-flash")
+    # Questions scoring at least this much go straight to the strong model
+    COMPLEXITY_THRESHOLD = int(os.getenv("ROUTER_COMPLEXITY_THRESHOLD", "2"))
+    # Questions whose fast-model SQL failed skip the fast model for this long
+    ESCALATION_MEMORY_SECONDS = float(os.getenv("ROUTER_ESCALATION_MEMORY_SECONDS", "3600"))
+
+# Keywords that imply a table is needed to answer the question
+TABLE_KEYWORDS = {
+    "DS-1": {
+        "bonus_pay": ["bonus", "tier"],
+        "orders": ["sale", "sales", "sold", "order", "orders", "amount", "valid", "invalid", "revenue"],
+        "salesperson": ["salesperson", "salespeople", "agent", "agents", "age", "oldest", "youngest", "who"],
+        "training": ["training", "trained", "train"]
+    },
+    "DS-2": {
+        "fact_commissions": ["commission", "commissions", "agent", "upline", "manager", "agency"]
+    }
+}
+
+BONUS_TIER_PATTERN = re.compile(r"\b(bonus|bonuses|tier|tiers)\b", re.IGNORECASE)
+
+# Cues for window functions, ranking and period over period comparisons
+ANALYTIC_CUES = [
+    "cumulative", "running", "rank", "top", "bottom", "highest", "lowest", "growth",
+    "percent", "percentage", "share", "compare", "comparison", "versus", " vs",
+    "difference", "over time", "year over year", "month over month", "average", "each"
+]
+
+STAGES_ON_FAST_MODEL = {"intent", "chat"}
+
+
+def extract_features(question: str, dataset: str, mentions_names: bool = False) -> dict:
+    lowered = question.lower()
+    words = set(re.findall(r"[a-z_]+", lowered))
+
+    tables = {
+        table for table, keywords in TABLE_KEYWORDS.get(dataset, {}).items()
+        if any(keyword in words for keyword in keywords)
+    }
+    if mentions_names and dataset == "DS-1":
+        tables.add("salesperson")
+
+    analytic_cues = sum(1 for cue in ANALYTIC_CUES if cue in lowered)
+    bonus_tier = bool(BONUS_TIER_PATTERN.search(question)) and dataset == "DS-1"
+    joins = max(len(tables) - 1, 0)
+
+    return {
+        "tables": sorted(tables),
+        "joins": joins,
+        "bonus_tier": bonus_tier,
+        "analytic_cues": analytic_cues,
+        "score": joins + 3 * bonus_tier + analytic_cues
+    }
+
+
+escalated_questions = TTLCache(ROUTER_CONFIG.ESCALATION_MEMORY_SECONDS, 1024)
+
+
+def choose_model(stage: str, dataset: str = None, question: str = "", mentions_names: bool = False) -> str:
+    if stage in STAGES_ON_FAST_MODEL:
+        return ROUTER_CONFIG.FAST_MODEL
+
+    if question and escalated_questions.get((dataset, normalize_question(question))):
+        return ROUTER_CONFIG.STRONG_MODEL
+
+    features = extract_features(question, dataset, mentions_names)
+    if features["score"] >= ROUTER_CONFIG.COMPLEXITY_THRESHOLD:
+        return ROUTER_CONFIG.STRONG_MODEL
+
+    return ROUTER_CONFIG.FAST_MODEL
+
+
+def remember_escalation(dataset: str, question: str):
+    escalated_questions.set((dataset, normalize_question(question)), True)
+
+
+FORBIDDEN_SQL = re.compile(r"\b(insert|update|delete|drop|alter|create|truncate|grant|revoke)\b", re.IGNORECASE)
+
+
+def validate_sql(query: str) -> Optional[str]:
+    """Cheap structural checks before a query is sent to run_sql. Returns the problem, or None."""
+    if not query:
+        return "empty query"
+    if not re.match(r"^\s*(select|with)\b", query, re.IGNORECASE):
+        return "query must start with SELECT or WITH"
+    if FORBIDDEN_SQL.search(query):
+        return "query must be read only"
+    if ";" in query:
+        return "query must be a single statement"
+    if query.count("(") != query.count(")"):
+        return "unbalanced parentheses"
+
+    return None
+
+
+class RouteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _route(self, route: str) -> dict:
+        return self._routes.setdefault(route, {
+            "calls": 0, "successes": 0, "failures": 0, "escalations": 0,
+            "total_seconds": 0.0, "max_seconds": 0.0
+        })
+
+    def record(self, route: str, seconds: float, success: bool):
+        with self._lock:
+            stats = self._route(route)
+            stats["calls"] += 1
+            stats["successes" if success else "failures"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def record_escalation(self, route: str):
+        with self._lock:
+            self._route(route)["escalations"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    **stats,
+                    "total_seconds": round(stats["total_seconds"], 4),
+                    "max_seconds": round(stats["max_seconds"], 4),
+                    "avg_seconds": round(stats["total_seconds"] / stats["calls"], 4) if stats["calls"] else None,
+                    "success_rate": round(stats["successes"] / stats["calls"], 4) if stats["calls"] else None
+                }
+                for route, stats in self._routes.items()
+            }
+
+route_stats = RouteStats()
+
+
+def route_name(dataset: str, stage: str, model: str) -> str:
+    return f"{dataset or 'TARS'}/{stage}/{model}"
+
+
+@contextmanager
+def track_route(dataset: str, stage: str, model: str):
+    """Records latency and success of one model call; an exception counts as a failure."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        route_stats.record(route_name(dataset, stage, model), time.perf_counter() - start, False)
+        raise
+    route_stats.record(route_name(dataset, stage, model), time.perf_counter() - start, True)
+
+
+def run_sql_with_escalation(dataset: str, question: str, query: str, model: str, regenerate, execute):
+    """
+    Validate and execute SQL produced by `model`. If it came from the fast model and
+    fails validation or raises, regenerate it with the strong model and try again.
+    An empty or null result is a valid answer and is returned as is.
+    `regenerate(model)` returns new SQL, `execute(query)` returns the rows.
+    Returns (query, rows).
+    """
+    start = time.perf_counter()
+    try:
+        problem = validate_sql(query)
+        if problem:
+            raise ValueError(f"Invalid SQL: {problem}")
+        rows = execute(query)
+        route_stats.record(route_name(dataset, "sql_execution", model), time.perf_counter() - start, True)
+        return query, rows
+    except Exception as error:
+        route_stats.record(route_name(dataset, "sql_execution", model), time.perf_counter() - start, False)
+        if model == ROUTER_CONFIG.STRONG_MODEL:
+            raise
+        print(f"{dataset} SQL from {model} failed ({error}), escalating to {ROUTER_CONFIG.STRONG_MODEL}")
+
+    route_stats.record_escalation(route_name(dataset, "sql_execution", model))
+    remember_escalation(dataset, question)
+
+    with track_route(dataset, "sql_execution", ROUTER_CONFIG.STRONG_MODEL):
+        query = regenerate(ROUTER_CONFIG.STRONG_MODEL)
+        problem = validate_sql(query)
+        if problem:
+            raise ValueError(f"Invalid SQL: {problem}")
+        rows = execute(query)
+
+    return query, rows
@@ -0,0 +1,112 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+@dataclass
+class SPECULATION_CONFIG:
+    ENABLED = os.getenv("SPECULATIVE_SQL", "true").lower() in ("1", "true", "yes")
+    MAX_WORKERS = int(os.getenv("SPECULATIVE_SQL_WORKERS", "8"))
+
+executor = ThreadPoolExecutor(max_workers=SPECULATION_CONFIG.MAX_WORKERS, thread_name_prefix="speculative-sql")
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        # The intent needed a different prompt than the one we guessed
+        self.misses = 0
+        # The intent did not need SQL at all (GENERAL_CHAT, agent commission buttons)
+        self.discarded = 0
+        # Misses and discards that were cancelled before a worker picked them up, so nothing was spent
+        self.cancelled = 0
+        # Hits that were still queued when needed and ran on the request thread instead
+        self.inline = 0
+        self.wasted_tokens = 0
+
+    def incr(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            resolved = self.hits + self.misses + self.discarded
+            return {
+                "launched": self.launched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+                "cancelled": self.cancelled,
+                "inline": self.inline,
+                "hit_rate": round(self.hits / resolved, 4) if resolved else None,
+                "wasted_tokens": self.wasted_tokens
+            }
+
+speculation_stats = SpeculationStats()
+
+
+class SpeculativeCall:
+    """
+    Runs `fn(*args, usage=..., **kwargs)` in the background while the intent is
+    being classified. `key` describes which variant was guessed, so the caller
+    can tell whether the guess matches the intent once it is known.
+    """
+
+    def __init__(self, key, fn, *args, **kwargs):
+        self.key = key
+        self.usage = {}
+        self.call = lambda: fn(*args, usage=self.usage, **kwargs)
+        self.future = executor.submit(self.call)
+        speculation_stats.incr("launched")
+
+    def take(self):
+        speculation_stats.incr("hits")
+        # Under load the pool falls behind, a request must never wait in its queue
+        # for work it can do itself
+        if self.future.cancel():
+            speculation_stats.incr("inline")
+            return self.call()
+        return self.future.result()
+
+    def discard(self, counter: str = "discarded"):
+        speculation_stats.incr(counter)
+        if self.future.cancel():
+            speculation_stats.incr("cancelled")
+            return
+
+        self.future.add_done_callback(
+            lambda _: speculation_stats.incr("wasted_tokens", self.usage.get("tokens", 0))
+        )
+
+    def resolve(self, key, fallback):
+        """Use the speculative result if the guess was right, otherwise discard it and run `fallback`."""
+        if key == self.key:
+            return self.take()
+
+        self.discard("misses")
+        return fallback()
+
+
+def speculate(key, fn, *args, **kwargs):
+    if not SPECULATION_CONFIG.ENABLED:
+        return None
+
+    return SpeculativeCall(key, fn, *args, **kwargs)
+
+
+def take_or_run(call, key, fallback):
+    if call is None:
+        return fallback()
+
+    return call.resolve(key, fallback)
+
+
+def record_usage(usage, response):
+    if usage is not None:
+        metadata = getattr(response, "usage_metadata", None)
+        usage["tokens"] = usage.get("tokens", 0) + (getattr(metadata, "total_token_count", 0) or 0)
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from .columnar import ColumnarResult, fetch_columnar
+
+load_dotenv()
+
+@dataclass
+class CACHE_CONFIG:
+    SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL_SECONDS", "3600"))
+    SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1024"))
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+    # "rows": run_sql returns one dict per row, "columnar": run_sql_columnar returns one array per column
+    RESULT_FORMAT = os.getenv("SQL_RESULT_FORMAT", "rows")
+
+
+class TTLCache:
+    """Small thread safe LRU cache where every entry expires after `ttl` seconds."""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# (dataset, prompt kind, normalized question) -> generated SQL
+sql_cache = TTLCache(CACHE_CONFIG.SQL_CACHE_TTL, CACHE_CONFIG.SQL_CACHE_SIZE)
+# SQL text -> rows returned by run_sql
+result_cache = TTLCache(CACHE_CONFIG.RESULT_CACHE_TTL, CACHE_CONFIG.RESULT_CACHE_SIZE)
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def run_sql(supabase, query: str, use_cache: bool = True):
+    if use_cache:
+        cached = result_cache.get(query)
+        if cached is not None:
+            return cached
+
+    if CACHE_CONFIG.RESULT_FORMAT == "columnar":
+        # Smaller payload, handed on as rows for the prompts. Chart queries use run_sql_columnar directly.
+        rows = fetch_columnar(supabase, query).to_rows()
+    else:
+        supabase_response = supabase.rpc(
+            "run_sql",
+            {"query": query}
+        ).execute()
+        rows = supabase_response.data
+
+    if use_cache and rows is not None:
+        result_cache.set(query, rows)
+
+    return rows
+
+
+def run_sql_columnar(supabase, query: str, use_cache: bool = True) -> ColumnarResult:
+    """Typed columns for callers that work on arrays or DataFrames instead of rows."""
+    cache_key = ("columnar", query)
+    if use_cache:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    result = fetch_columnar(supabase, query)
+    if use_cache:
+        result_cache.set(cache_key, result)
+
+    return result
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from . import ds1, ds2
+from .clients import supabase, gemini_client
+from .sql_cache import run_sql
+
+load_dotenv()
+
+@dataclass
+class WARMUP_CONFIG:
+    ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+    # JSON lists of frequently asked questions, e.g. '["what is the total valid sales in 2023?"]'
+    HOT_QUESTIONS_DS1 = os.getenv("WARMUP_HOT_QUESTIONS_DS1", "[]")
+    HOT_QUESTIONS_DS2 = os.getenv("WARMUP_HOT_QUESTIONS_DS2", "[]")
+    PROBE_MODEL = os.getenv("WARMUP_PROBE_MODEL", "gemini-2.0-flash")
+    PROBE_QUERY = "select 1 as ok"
+    MAX_WORKERS = int(os.getenv("WARMUP_MAX_WORKERS", "4"))
+    # /application_initialization reuses the last report while it is this recent
+    MIN_INTERVAL_SECONDS = float(os.getenv("WARMUP_MIN_INTERVAL_SECONDS", "300"))
+
+_warm_up_lock = threading.Lock()
+last_report = None
+last_run_at = None
+
+
+def load_hot_questions(raw: str) -> list:
+    try:
+        questions = json.loads(raw)
+    except json.JSONDecodeError:
+        print(f"Invalid hot question list: {raw}")
+        return []
+
+    return [q for q in questions if isinstance(q, str) and q.strip()]
+
+
+def timed_step(name: str, fn) -> dict:
+    start = time.perf_counter()
+    try:
+        fn()
+        ok, error = True, None
+    except Exception as exc:
+        ok, error = False, str(exc)
+
+    return {
+        "step": name,
+        "success": ok,
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": error
+    }
+
+
+def warm_hot_question(generate_sql, execute_sql, question: str):
+    # Generated SQL is only cached once it has run, so go through the execute step
+    execute_sql(question, generate_sql(question))
+
+
+def warm_up(force: bool = False) -> dict:
+    """
+    Warm the instance up, or return the last report if that ran within
+    MIN_INTERVAL_SECONDS. `force` always runs it, as on startup.
+    """
+    global last_report, last_run_at
+
+    # Concurrent callers wait for the run in progress instead of starting another one
+    with _warm_up_lock:
+        if not force and last_run_at is not None and time.monotonic() - last_run_at < WARMUP_CONFIG.MIN_INTERVAL_SECONDS:
+            return {**last_report, "reused": True}
+
+        last_report = _run_warm_up()
+        last_run_at = time.monotonic()
+        return last_report
+
+
+def _run_warm_up() -> dict:
+    """
+    Open connections to Gemini and Supabase, run a cheap run_sql probe, load the
+    entity name indexes and pre-populate the SQL/result caches with the
+    configured hot questions.
+    """
+    total_start = time.perf_counter()
+
+    tasks = [
+        ("gemini_connect", lambda: gemini_client.models.get(model=WARMUP_CONFIG.PROBE_MODEL)),
+        ("run_sql_probe", lambda: run_sql(supabase, WARMUP_CONFIG.PROBE_QUERY, use_cache=False)),
+        ("entity_index:ds1", ds1.entity_index.refresh),
+        ("entity_index:ds2", ds2.entity_index.refresh)
+    ]
+
+    # Connections first so the hot questions below reuse them
+    with ThreadPoolExecutor(max_workers=WARMUP_CONFIG.MAX_WORKERS) as pool:
+        steps = list(pool.map(lambda task: timed_step(*task), tasks))
+
+    hot_tasks = []
+    for question in load_hot_questions(WARMUP_CONFIG.HOT_QUESTIONS_DS1):
+        hot_tasks.append((
+            f"hot_question:DS-1:{question}",
+            lambda q=question: warm_hot_question(ds1.generate_sql_ds1, ds1.execute_sql_ds1, q)
+        ))
+    for question in load_hot_questions(WARMUP_CONFIG.HOT_QUESTIONS_DS2):
+        hot_tasks.append((
+            f"hot_question:DS-2:{question}",
+            lambda q=question: warm_hot_question(ds2.generate_sql_ds2, ds2.execute_sql_ds2, q)
+        ))
+
+    with ThreadPoolExecutor(max_workers=WARMUP_CONFIG.MAX_WORKERS) as pool:
+        steps.extend(pool.map(lambda task: timed_step(*task), hot_tasks))
+
+    for step in steps:
+        print(f"Warm-up {step['step']}: {step['seconds']}s {'ok' if step['success'] else step['error']}")
+
+    return {
+        "success": all(step["success"] for step in steps),
+        "total_seconds": round(time.perf_counter() - total_start, 4),
+        "steps": steps
+    }
@@ -0,0 +1,286 @@
+"""
+Concurrent load test for the chat API against simulated Gemini and Supabase backends.
+
+    python loadtest/run.py --concurrency 1 4 16 64 --duration 20 --mix DS-1=0.4,DS-2=0.4,TARS=0.2 \
+        --gemini-latency-ms 800 --supabase-latency-ms 120 --gemini-error-rate 0.01 --output loadtest.json
+
+Starts loadtest/server.py (app.py under uvicorn), drives POST /chat at each concurrency
+level in turn and reports throughput, p50/p95/p99 latency and error rates per level and
+per dataset. --max-p95-ms and --max-error-rate make it exit non-zero when a level
+breaches them, so it can gate a deploy. Use --url to test an already running server.
+
+The SQL and result caches are off unless --cache is given: with a handful of fixed
+questions they would answer nearly every request and SQL generation would never be loaded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+QUESTIONS = {
+    "DS-1": [
+        "What were total sales last month?",
+        "Who is the top salesperson this year?",
+        "Show monthly sales as a line chart",
+        "How many orders did Avery Rodriguez close in Q2?",
+        "Plot sales by region as a bar graph"
+    ],
+    "DS-2": [
+        "What is the total commission paid this year?",
+        "Show commissions per month as a bar chart",
+        "Which agency earned the most commission last quarter?",
+        "List the top 10 agents by commission amount",
+        "Display commission by agency as a pie chart"
+    ],
+    "TARS": [
+        "Hello, what can you help me with?",
+        "Explain what a commission tier is",
+        "Summarize what we talked about so far",
+        "How do I pick the right dataset agent?"
+    ]
+}
+
+# Agents answer with these instead of raising, count them as errors
+AGENT_ERROR_PREFIXES = (
+    "Your request was unable to be processed",
+    "The model was unable to",
+    "Please rephrase your question",
+    "TARS was unable to understand",
+    "No response from DS-",
+    "No data found"
+)
+
+SERVER_OPTIONS = (
+    "gemini_latency_ms", "gemini_jitter_ms", "gemini_error_rate",
+    "supabase_latency_ms", "supabase_jitter_ms", "supabase_error_rate", "rows"
+)
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().upper()
+        if name not in QUESTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown dataset {name!r}, expected one of {', '.join(QUESTIONS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("At least one dataset needs a positive weight")
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=15, help="seconds per concurrency level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("DS-1=0.4,DS-2=0.4,TARS=0.2"))
+    parser.add_argument("--history", type=int, default=6, help="history messages sent with TARS requests")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--url", default=None, help="test a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=200)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=120)
+    parser.add_argument("--supabase-jitter-ms", type=float, default=30)
+    parser.add_argument("--supabase-error-rate", type=float, default=0.0)
+    parser.add_argument("--rows", type=int, default=24)
+    parser.add_argument("--cache", action="store_true", help="keep the SQL and result caches on the server enabled")
+    parser.add_argument("--server-log", default=None, help="write the server output to this file instead of discarding it")
+    parser.add_argument("--output", default=None, help="write the report as JSON to this file")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    return parser.parse_args(argv)
+
+
+def start_server(args) -> subprocess.Popen:
+    command = [sys.executable, "-m", "loadtest.server", "--port", str(args.port)]
+    for option in SERVER_OPTIONS:
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    if not args.cache:
+        command.append("--no-cache")
+
+    # The agents print every query and result, keep that out of the report
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_for_server(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout:.0f}s")
+
+
+def build_request(dataset: str, history_length: int) -> dict:
+    body = {"message": random.choice(QUESTIONS[dataset]), "dataset": dataset}
+    if dataset == "TARS" and history_length:
+        body["history"] = [
+            {"role": "user" if idx % 2 == 0 else "model", "content": f"Earlier message {idx}"}
+            for idx in range(history_length)
+        ]
+    return body
+
+
+def is_agent_error(payload: dict) -> bool:
+    return str(payload.get("response", "")).startswith(AGENT_ERROR_PREFIXES)
+
+
+async def worker(client: httpx.AsyncClient, args, deadline: float, samples: list):
+    datasets = list(args.mix)
+    weights = [args.mix[name] for name in datasets]
+
+    while time.monotonic() < deadline:
+        dataset = random.choices(datasets, weights)[0]
+        body = build_request(dataset, args.history)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            response = await client.post("/chat", json=body)
+            if response.status_code != 200:
+                outcome = "http_error"
+            elif is_agent_error(response.json()):
+                outcome = "agent_error"
+        except (httpx.HTTPError, ValueError):
+            outcome = "exception"
+        samples.append((dataset, time.perf_counter() - start, outcome))
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    latencies = sorted(latency for _, latency, _ in samples)
+    outcomes = defaultdict(int)
+    for _, _, outcome in samples:
+        outcomes[outcome] += 1
+
+    total = len(samples)
+    failed = total - outcomes["ok"]
+    return {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "errors": {name: count for name, count in outcomes.items() if name != "ok"}
+    }
+
+
+async def run_level(url: str, args, concurrency: int) -> dict:
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*(worker(client, args, deadline, samples) for _ in range(concurrency)))
+        # Requests in flight at the deadline still finish, count them in the window
+        elapsed = time.monotonic() - start
+
+        metrics = None
+        try:
+            metrics = (await client.get("/metrics")).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+    by_dataset = defaultdict(list)
+    for sample in samples:
+        by_dataset[sample[0]].append(sample)
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "overall": summarize(samples, elapsed),
+        "datasets": {dataset: summarize(items, elapsed) for dataset, items in sorted(by_dataset.items())},
+        "server_metrics": metrics
+    }
+
+
+def print_header():
+    header = f"{'conc':>5} {'dataset':>8} {'reqs':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}"
+    print(header)
+    print("-" * len(header))
+
+
+def print_level(level: dict):
+    rows = [("all", level["overall"])] + list(level["datasets"].items())
+    for name, stats in rows:
+        print(
+            f"{level['concurrency']:>5} {name:>8} {stats['requests']:>7} {stats['throughput_rps']:>8.2f} "
+            f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['error_rate']:>8.2%}"
+        )
+
+
+def check_thresholds(levels: list, args) -> list:
+    failures = []
+    for level in levels:
+        stats = level["overall"]
+        if args.max_p95_ms is not None and stats["p95_ms"] > args.max_p95_ms:
+            failures.append(f"concurrency {level['concurrency']}: p95 {stats['p95_ms']:.1f} ms > {args.max_p95_ms:.1f} ms")
+        if args.max_error_rate is not None and stats["error_rate"] > args.max_error_rate:
+            failures.append(f"concurrency {level['concurrency']}: error rate {stats['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    return failures
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    process = None
+    url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        process = start_server(args)
+
+    try:
+        wait_for_server(url, process)
+        print_header()
+
+        levels = []
+        for concurrency in args.concurrency:
+            level = asyncio.run(run_level(url, args, concurrency))
+            levels.append(level)
+            print_level(level)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    if args.output:
+        report = {
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "levels": levels
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_thresholds(levels, args)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Run app.py under uvicorn with simulated Gemini and Supabase backends.
+
+    python -m loadtest.server --port 8765 --gemini-latency-ms 800 --supabase-latency-ms 120 --gemini-error-rate 0.01
+
+Started by loadtest/run.py, but can also be run on its own to poke at the app by hand.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=200)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=120)
+    parser.add_argument("--supabase-jitter-ms", type=float, default=30)
+    parser.add_argument("--supabase-error-rate", type=float, default=0.0)
+    parser.add_argument("--rows", type=int, default=24, help="rows returned by every simulated run_sql call")
+    parser.add_argument("--no-cache", action="store_true", help="expire SQL and result cache entries immediately")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    # The real clients are still constructed on import, they only need well formed settings
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "simulated.simulated.simulated")
+    os.environ.setdefault("GEMINI_API_KEY", "simulated")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    if args.no_cache:
+        os.environ["SQL_CACHE_TTL_SECONDS"] = "0"
+        os.environ["RESULT_CACHE_TTL_SECONDS"] = "0"
+
+
+def install_simulated_backends(gemini, supabase):
+    """Swap the shared clients everywhere they were imported by name."""
+    import app
+    from helpers import clients, ds1, ds2, general_helpers, history, warmup
+
+    for module in (clients, app, ds1, ds2, general_helpers, history, warmup):
+        if hasattr(module, "gemini_client"):
+            module.gemini_client = gemini
+        if hasattr(module, "supabase"):
+            module.supabase = supabase
+
+    ds1.entity_index.supabase = supabase
+    ds2.entity_index.supabase = supabase
+
+    return app.app
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+
+    import uvicorn
+    from loadtest.simulated_backends import BackendProfile, SimulatedGeminiClient, SimulatedSupabaseClient
+
+    gemini = SimulatedGeminiClient(BackendProfile(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_error_rate))
+    supabase = SimulatedSupabaseClient(
+        BackendProfile(args.supabase_latency_ms, args.supabase_jitter_ms, args.supabase_error_rate),
+        row_count=args.rows
+    )
+
+    application = install_simulated_backends(gemini, supabase)
+    uvicorn.run(application, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Stand-ins for the Gemini and Supabase clients with configurable latency and error
+rate, so the app can be load tested without spending tokens or hitting the database.
+They implement only the calls the app makes.
+"""
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from helpers.columnar import rows_to_columnar
+
+
+@dataclass
+class BackendProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def wait(self, name: str):
+        delay = max(random.gauss(self.latency_ms, self.jitter_ms), 0.0) / 1000
+        time.sleep(delay)
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"Simulated {name} error")
+
+
+def _response(text: str) -> SimpleNamespace:
+    # Roughly 4 characters per token, good enough for the wasted token counters
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=len(text) // 4 + 1))
+
+
+USER_REQUEST_PATTERN = re.compile(r'Analyze the user request:\s*"(.*?)"', re.DOTALL)
+CHART_WORDS = ("chart", "graph", "plot", "bar", "line", "pie", "visualize", "show as", "display as")
+
+
+def classify(question: str) -> dict:
+    lowered = question.lower()
+    if any(word in lowered for word in CHART_WORDS):
+        chart_type = next((t for t in ("pie", "bar", "line") if t in lowered), "line")
+        return {"intent": "GENERATE_CHART", "chart_type": chart_type}
+    if lowered.startswith(("hi", "hello", "hey", "thanks")):
+        return {"intent": "GENERAL_CHAT"}
+    return {"intent": "QUERY_DATA", "sub_intent": "GENERAL"}
+
+
+class SimulatedModels:
+    def __init__(self, profile: BackendProfile):
+        self.profile = profile
+
+    def get(self, model: str):
+        self.profile.wait("Gemini")
+        return SimpleNamespace(name=model)
+
+    def generate_content(self, model: str, contents, config=None):
+        self.profile.wait("Gemini")
+        prompt = str(contents)
+
+        if config and "response_schema" in config:
+            match = USER_REQUEST_PATTERN.search(prompt)
+            return _response(json.dumps(classify(match.group(1) if match else "")))
+
+        if "Return only the PostgreSQL query" in prompt:
+            return _response(
+                "```sql\nselect commission_month, agent_name, sum(commission_amount) as commission_amount "
+                "from fact_commissions group by commission_month, agent_name order by commission_month;\n```"
+            )
+
+        return _response("Simulated answer based on the query result.")
+
+
+class SimulatedChat:
+    def __init__(self, profile: BackendProfile):
+        self.profile = profile
+
+    def send_message(self, message: str):
+        self.profile.wait("Gemini")
+        return _response(f"Simulated TARS reply to: {message}")
+
+    def send_message_stream(self, message: str):
+        self.profile.wait("Gemini")
+        for word in f"Simulated TARS reply to: {message}".split(" "):
+            yield _response(word + " ")
+
+
+class SimulatedChats:
+    def __init__(self, profile: BackendProfile):
+        self.profile = profile
+
+    def create(self, model: str, history=None, config=None):
+        return SimulatedChat(self.profile)
+
+
+class SimulatedGeminiClient:
+    def __init__(self, profile: BackendProfile):
+        self.models = SimulatedModels(profile)
+        self.chats = SimulatedChats(profile)
+
+
+class SimulatedRpc:
+    def __init__(self, profile: BackendProfile, function: str, query: str, row_count: int):
+        self.profile = profile
+        self.function = function
+        self.query = query
+        self.row_count = row_count
+
+    def rows(self) -> list:
+        if " as value" in self.query:
+            # Distinct name lookups for the entity index
+            return [{"value": f"Agent {i}"} for i in range(50)]
+
+        agents = max(self.row_count // 12, 1)
+        return [
+            {
+                "commission_month": idx // agents + 1,
+                "agent_name": f"Agent {idx % agents}",
+                "commission_amount": round(random.uniform(100, 5000), 2)
+            }
+            for idx in range(self.row_count)
+        ]
+
+    def execute(self):
+        self.profile.wait("Supabase")
+        rows = self.rows()
+        data = rows_to_columnar(rows) if self.function == "run_sql_columnar" else rows
+        return SimpleNamespace(data=data)
+
+
+class SimulatedSupabaseClient:
+    def __init__(self, profile: BackendProfile, row_count: int = 24):
+        self.profile = profile
+        self.row_count = row_count
+
+    def rpc(self, function: str, params: dict):
+        return SimulatedRpc(self.profile, function, params.get("query", ""), self.row_count)
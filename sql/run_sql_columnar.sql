@@ -0,0 +1,44 @@
+-- Columnar variant of run_sql: column names and JSON types once, then one value array per column.
+-- Deploy next to run_sql and grant it to the same roles, e.g.
+--   grant execute on function run_sql_columnar(text) to anon, authenticated;
+-- With zero rows the column list is empty, because names are read from the first row.
+create or replace function run_sql_columnar(query text)
+returns json
+language plpgsql
+as $$
+declare
+    result_rows json;
+    result json;
+begin
+    execute format('select coalesce(json_agg(t), ''[]''::json) from (%s) t', query) into result_rows;
+
+    if json_array_length(result_rows) = 0 then
+        return json_build_object('columns', '[]'::json, 'row_count', 0, 'data', '[]'::json);
+    end if;
+
+    select json_build_object(
+        'columns', json_agg(json_build_object('name', c.name, 'type', c.type) order by c.position),
+        'row_count', json_array_length(result_rows),
+        'data', json_agg(c.vals order by c.position)
+    )
+    into result
+    from (
+        select
+            k.name,
+            k.position,
+            coalesce((
+                select json_typeof(r.value -> k.name)
+                from json_array_elements(result_rows) as r(value)
+                where json_typeof(r.value -> k.name) <> 'null'
+                limit 1
+            ), 'null') as type,
+            (
+                select json_agg(r.value -> k.name order by r.position)
+                from json_array_elements(result_rows) with ordinality as r(value, position)
+            ) as vals
+        from json_object_keys(result_rows -> 0) with ordinality as k(name, position)
+    ) c;
+
+    return result;
+end;
+$$;
@@ -0,0 +1,50 @@
+import pytest
+
+from helpers import ds1, ds2
+from helpers.columnar import decode_columnar, rows_to_columnar
+
+ROWS = [
+    {"id": 1, "agent_name": "Avery", "commission_month": 1, "commission_amount": 120.5},
+    {"id": 2, "agent_name": "Jordan", "commission_month": 1, "commission_amount": None},
+    {"id": 3, "agent_name": "Avery", "commission_month": 2, "commission_amount": 98.0},
+]
+
+
+def both_forms(rows):
+    return [rows, decode_columnar(rows_to_columnar(rows))]
+
+
+@pytest.mark.parametrize("data", both_forms(ROWS))
+def test_ds2_line_chart(data):
+    assert ds2.format_data_for_line_or_bar_chart(data) == [
+        {"period": "1", "Avery": 120.5},
+        {"period": "2", "Avery": 98.0},
+    ]
+
+
+@pytest.mark.parametrize("data", both_forms(ROWS))
+def test_ds2_pie_chart(data):
+    assert ds2.format_data_for_pie_chart(data) == [
+        {"name": "Avery", "value": 120.5},
+        {"name": "Jordan", "value": 0.0},
+        {"name": "Avery", "value": 98.0},
+    ]
+
+
+@pytest.mark.parametrize("data", both_forms([{"name": "Avery", "total_sales": 10, "order_count": 2}]))
+def test_ds1_bar_chart(data):
+    assert ds1.format_data_for_line_or_bar_chart(data, chart_type="bar") == [{"name": "Avery", "value": 10.0}]
+
+
+@pytest.mark.parametrize("data", both_forms([{"salesperson_name": "Avery", "label": "x", "total": None}]))
+def test_ds1_pie_chart_without_numbers(data):
+    assert ds1.format_data_for_pie_chart(data) == []
+
+
+@pytest.mark.parametrize("formatter", [
+    ds1.format_data_for_line_or_bar_chart, ds1.format_data_for_pie_chart,
+    ds2.format_data_for_line_or_bar_chart, ds2.format_data_for_pie_chart,
+])
+def test_empty_results(formatter):
+    assert formatter([]) == []
+    assert formatter(decode_columnar(None)) == []
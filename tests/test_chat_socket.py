@@ -0,0 +1,130 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from app import WS_ROWS_PREVIEW, SocketMessage, handle_socket_message, new_chat_session
+from helpers import clients, ds1, ds2, general_helpers, history, warmup
+from helpers.general_helpers import UserIntentDS2
+from helpers.sql_cache import result_cache, sql_cache
+from loadtest.server import install_simulated_backends
+from loadtest.simulated_backends import BackendProfile, SimulatedGeminiClient, SimulatedSupabaseClient
+
+ROW_COUNT = 60
+COMMISSION_QUESTION = "What commission did the agents earn this year?"
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    # Let monkeypatch put the real clients back once the test is done
+    for module in (clients, app_module, ds1, ds2, general_helpers, history, warmup):
+        for name in ("gemini_client", "supabase"):
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, getattr(module, name))
+    for index in (ds1.entity_index, ds2.entity_index):
+        monkeypatch.setattr(index, "supabase", index.supabase)
+
+    install_simulated_backends(SimulatedGeminiClient(BackendProfile()), SimulatedSupabaseClient(BackendProfile(), row_count=ROW_COUNT))
+    sql_cache.clear()
+    result_cache.clear()
+    yield
+    sql_cache.clear()
+    result_cache.clear()
+
+
+@pytest.fixture
+def commission_queries(monkeypatch):
+    """Classify every new DS-2 question as an agent commission question and record what the agent is asked."""
+    queries = []
+    agent = app_module.chat_with_agent_ds2
+    monkeypatch.setattr(app_module, "get_intent_ds2", lambda user_input: UserIntentDS2(intent="QUERY_DATA", sub_intent="AGENT_COMMISSIONS"))
+    monkeypatch.setattr(app_module, "chat_with_agent_ds2", lambda query, **kwargs: queries.append(query) or agent(query, **kwargs))
+    return queries
+
+
+def receive_until_response(websocket) -> list:
+    events = []
+    while True:
+        events.append(websocket.receive_json())
+        if events[-1]["event"] in ("response", "error"):
+            return events
+
+
+def send(session: dict, message: str, dataset: str = None, events: list = None) -> dict:
+    on_event = (lambda event, data: events.append((event, data))) if events is not None else (lambda event, data: None)
+    return handle_socket_message(session, SocketMessage(message=message, dataset=dataset), on_event)
+
+
+def test_websocket_keeps_dataset_between_messages(backends):
+    with TestClient(app_module.app).websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"message": "What is the total commission paid this year?", "dataset": "DS-2"})
+        first = receive_until_response(websocket)
+        # No dataset on the second message, it must still go to DS-2 and not to TARS
+        websocket.send_json({"message": "List the top 10 agents by commission amount"})
+        second = receive_until_response(websocket)
+
+    for events in (first, second):
+        names = [event["event"] for event in events]
+        assert names[0] == "intent"
+        assert "sql" in names
+        assert names[-1] == "response"
+        rows = next(event for event in events if event["event"] == "rows")
+        assert rows["row_count"] == ROW_COUNT
+        assert len(rows["rows"]) == WS_ROWS_PREVIEW
+
+
+def test_websocket_consolidate_follow_up(backends, commission_queries):
+    with TestClient(app_module.app).websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"message": COMMISSION_QUESTION, "dataset": "DS-2"})
+        prompt = receive_until_response(websocket)[-1]["data"]
+        websocket.send_json({"message": "Consolidate"})
+        answer = receive_until_response(websocket)[-1]
+
+    assert prompt["show_buttons"] is True
+    assert prompt["buttons"] == ["Consolidate", "Upline Manager"]
+    assert answer["event"] == "response"
+    assert commission_queries == [f"{COMMISSION_QUESTION} and consolidate them"]
+
+
+def test_upline_manager_follow_up_state(backends, commission_queries):
+    session = new_chat_session()
+
+    send(session, COMMISSION_QUESTION, "DS-2")
+    assert session["state"] == {"last_commission_query": COMMISSION_QUESTION}
+
+    reply = send(session, "Upline Manager")
+    assert reply == {"response": "Please provide the name or ID of the upline manager."}
+    assert session["state"]["waiting_for_manager"] is True
+
+    send(session, "Jordan Mayfield")
+    assert commission_queries == [f"{COMMISSION_QUESTION} for upline manager Jordan Mayfield"]
+    assert session["state"] == {}
+
+
+def test_session_keeps_last_sql_and_all_rows(backends):
+    session = new_chat_session()
+    events = []
+
+    send(session, "What were total sales last month?", "DS-1", events)
+
+    assert session["dataset"] == "DS-1"
+    assert session["last_sql"].startswith("select commission_month")
+    assert len(session["last_rows"]) == ROW_COUNT
+    assert ("sql", {"query": session["last_sql"]}) in events
+    sent_rows = next(data for event, data in events if event == "rows")
+    assert sent_rows == {"row_count": ROW_COUNT, "rows": session["last_rows"][:WS_ROWS_PREVIEW]}
+
+
+def test_history_is_trimmed(monkeypatch):
+    monkeypatch.setattr(app_module, "WS_MAX_HISTORY_MESSAGES", 4)
+    monkeypatch.setattr(app_module, "handle_chat_message", lambda user_input, *args: {"response": f"Reply to {user_input}"})
+    session = new_chat_session()
+
+    for idx in range(3):
+        send(session, f"Question {idx}")
+
+    assert session["history"] == [
+        {"role": "user", "content": "Question 1"},
+        {"role": "model", "content": "Reply to Question 1"},
+        {"role": "user", "content": "Question 2"},
+        {"role": "model", "content": "Reply to Question 2"}
+    ]
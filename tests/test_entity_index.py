@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.entity_index import ENTITY_INDEX_CONFIG, EntityIndex, with_correction_note
+
+NAMES = ["Alice", "Marcy", "Augustine", "Avery Rodriguez", "June Park", "Jordan Mayfield", "Autumn", "Mason"]
+
+
+class FakeSupabase:
+    def __init__(self, names):
+        self.names = names
+
+    def rpc(self, function, params):
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[{"value": name} for name in self.names]))
+
+
+@pytest.fixture
+def index():
+    return EntityIndex({"agent_name": "select distinct agent_name as value from dim_agent"}, FakeSupabase(NAMES))
+
+
+@pytest.mark.parametrize("question", [
+    "total sales in March 2023",
+    "sales for Mar and Apr",
+    "commissions paid on Monday",
+    "orders since last week",
+    "total sales in August",
+])
+def test_date_words_are_not_rewritten(index, question):
+    assert index.resolve(question)[0] == question
+
+
+def test_truncated_word_does_not_match_longer_name(index):
+    assert index.resolve("Alice's sales since August") == ("Alice's sales since August", [("Alice", "Alice", "agent_name", 1.0)])
+
+
+def test_misspelled_names_are_corrected(index):
+    assert index.resolve("sales for Alcie")[0] == "sales for Alice"
+    assert index.resolve("sales for avery rodriges")[0] == "sales for Avery Rodriguez"
+
+
+def test_possessive_is_kept(index):
+    assert index.resolve("Alcie's commissions")[0] == "Alice's commissions"
+
+
+def test_exact_name_containing_date_word(index):
+    question, resolutions = index.resolve("sales for June Park in June")
+    assert question == "sales for June Park in June"
+    assert resolutions == [("June Park", "June Park", "agent_name", 1.0)]
+
+
+def test_lowercase_words_are_not_names(index):
+    assert index.resolve("sales in spring and autumn") == ("sales in spring and autumn", [])
+    assert index.resolve("sales for Autumn")[1] == [("Autumn", "Autumn", "agent_name", 1.0)]
+
+
+def test_name_with_another_first_letter_is_not_swapped(index):
+    assert index.resolve("sales for Jason") == ("sales for Jason", [])
+
+
+def test_correction_note_lists_changed_names(index):
+    _, resolutions = index.resolve("sales for Alcie and Avery Rodriguez")
+    assert with_correction_note("42", resolutions) == 'Showing results for Alice instead of "Alcie".\n\n42'
+    assert with_correction_note("42", index.resolve("sales for avery rodriguez")[1]) == "42"
+
+
+class FailingSupabase:
+    def __init__(self):
+        self.calls = 0
+
+    def rpc(self, function, params):
+        self.calls += 1
+        raise ConnectionError("database unavailable")
+
+
+def test_failed_refresh_is_not_retried_on_every_question(monkeypatch):
+    supabase = FailingSupabase()
+    index = EntityIndex({"agent_name": "select distinct agent_name as value from dim_agent"}, supabase)
+
+    assert index.resolve("sales for Alice") == ("sales for Alice", [])
+    assert index.resolve("sales for Alice") == ("sales for Alice", [])
+    assert supabase.calls == 1
+
+    monkeypatch.setattr(ENTITY_INDEX_CONFIG, "RETRY_SECONDS", 0)
+    index.resolve("sales for Alice")
+    assert supabase.calls == 2
@@ -0,0 +1,49 @@
+import pytest
+
+from helpers import history
+from helpers.history import HISTORY_CONFIG, estimate_tokens, find_split_index
+
+
+def conversation(count: int, size: int = 800) -> list:
+    return [
+        {"role": "user" if idx % 2 == 0 else "model", "content": str(idx % 10) * size}
+        for idx in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count", [16, 20, 21, 30])
+def test_verbatim_history_stays_within_budget(count):
+    messages = conversation(count)
+    split = find_split_index(messages)
+
+    assert sum(estimate_tokens(m["content"]) for m in messages[split:]) <= HISTORY_CONFIG.TOKEN_BUDGET
+    assert messages[split]["role"] == "user"
+
+
+def test_split_rounds_up_to_chunk_boundary():
+    # 800 character messages are ~200 tokens, 9 fit in the default 2000 token budget
+    assert len(conversation(20)[find_split_index(conversation(20)):]) == 8
+
+
+def test_minimum_recent_messages_win_over_budget(monkeypatch):
+    monkeypatch.setattr(HISTORY_CONFIG, "MIN_RECENT_MESSAGES", 4)
+    messages = conversation(10, size=4000)
+
+    assert find_split_index(messages) == 6
+
+
+def test_no_minimum_recent_messages(monkeypatch):
+    monkeypatch.setattr(HISTORY_CONFIG, "MIN_RECENT_MESSAGES", 0)
+    messages = conversation(10, size=10000)
+
+    assert find_split_index(messages) == 10
+
+
+def test_compact_history_without_recent_messages(monkeypatch):
+    monkeypatch.setattr(HISTORY_CONFIG, "MIN_RECENT_MESSAGES", 0)
+    monkeypatch.setattr(history, "summarize_messages", lambda previous, messages: f"{len(messages)} messages")
+
+    summary, recent = history.compact_history(conversation(10, size=10000))
+
+    assert summary == "10 messages"
+    assert recent == []
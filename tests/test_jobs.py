@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from helpers import jobs
+from helpers.jobs import get_job, submit_job, wait_for_job
+
+
+def test_running_job_is_not_evicted(monkeypatch):
+    monkeypatch.setattr(jobs.jobs, "maxsize", 2)
+    release = threading.Event()
+
+    try:
+        running = submit_job(("test", "slow"), release.wait)
+        finished = [submit_job(("test", idx), lambda value=idx: value) for idx in range(5)]
+        for job in finished:
+            assert job["done"].wait(5)
+
+        assert get_job(running["job_id"]) is running
+        assert get_job(finished[0]["job_id"]) is None
+    finally:
+        release.set()
+
+    assert running["done"].wait(5)
+    assert get_job(running["job_id"])["status"] == "done"
+
+
+def test_wait_for_job():
+    release = threading.Event()
+    job = submit_job(("test", "wait"), release.wait)
+
+    try:
+        assert asyncio.run(wait_for_job(job, 0.3)) is False
+        threading.Timer(0.2, release.set).start()
+        assert asyncio.run(wait_for_job(job, 5)) is True
+    finally:
+        release.set()
+
+
+def test_identical_submission_joins_running_job():
+    release = threading.Event()
+
+    try:
+        first = submit_job(("test", "join"), release.wait)
+        assert submit_job(("test", "join"), release.wait) is first
+    finally:
+        release.set()
+    assert first["done"].wait(5)
+
+
+def test_finished_job_is_not_reused():
+    replies = iter(["Please rephrase your question", "chart"])
+
+    first = submit_job(("test", "retry"), lambda: next(replies))
+    assert first["done"].wait(5)
+    second = submit_job(("test", "retry"), lambda: next(replies))
+    assert second["done"].wait(5)
+
+    assert second["job_id"] != first["job_id"]
+    assert (first["result"], second["result"]) == ("Please rephrase your question", "chart")
+    # The earlier result can still be fetched by id
+    assert get_job(first["job_id"]) is first
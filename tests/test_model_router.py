@@ -0,0 +1,106 @@
+import pytest
+
+from helpers import model_router
+from helpers.model_router import ROUTER_CONFIG, escalated_questions, route_stats, run_sql_with_escalation
+
+QUESTION = "total commission per agent"
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    escalated_questions.clear()
+    yield
+    escalated_questions.clear()
+
+
+def fail_regenerate(model):
+    raise AssertionError("regenerate should not be called")
+
+
+def test_empty_result_is_not_escalated():
+    result = run_sql_with_escalation(
+        "DS-2", QUESTION, "select 1", ROUTER_CONFIG.FAST_MODEL,
+        regenerate=fail_regenerate, execute=lambda query: None
+    )
+
+    assert result == ("select 1", None)
+    assert model_router.choose_model("sql", "DS-2", QUESTION) == ROUTER_CONFIG.FAST_MODEL
+
+
+def test_fast_model_failure_escalates_and_is_remembered():
+    executed = []
+
+    def execute(query):
+        executed.append(query)
+        if query == "select broken":
+            raise RuntimeError("column does not exist")
+        return [{"total": 1}]
+
+    route = model_router.route_name("DS-2", "sql_execution", ROUTER_CONFIG.FAST_MODEL)
+    escalations = route_stats.snapshot().get(route, {}).get("escalations", 0)
+
+    result = run_sql_with_escalation(
+        "DS-2", QUESTION, "select broken", ROUTER_CONFIG.FAST_MODEL,
+        regenerate=lambda model: f"select fixed_by_{model}", execute=execute
+    )
+
+    assert result == (f"select fixed_by_{ROUTER_CONFIG.STRONG_MODEL}", [{"total": 1}])
+    assert executed == ["select broken", f"select fixed_by_{ROUTER_CONFIG.STRONG_MODEL}"]
+    assert route_stats.snapshot()[route]["escalations"] == escalations + 1
+    # The next attempt at the same question goes straight to the strong model
+    assert model_router.choose_model("sql", "DS-2", f"  {QUESTION.upper()} ") == ROUTER_CONFIG.STRONG_MODEL
+
+
+def test_strong_model_failure_is_raised():
+    def execute(query):
+        raise RuntimeError("permission denied")
+
+    with pytest.raises(RuntimeError, match="permission denied"):
+        run_sql_with_escalation(
+            "DS-2", QUESTION, "select 1", ROUTER_CONFIG.STRONG_MODEL,
+            regenerate=fail_regenerate, execute=execute
+        )
+    assert model_router.choose_model("sql", "DS-2", QUESTION) == ROUTER_CONFIG.FAST_MODEL
+
+
+def test_invalid_fast_sql_is_regenerated_without_running():
+    executed = []
+
+    result = run_sql_with_escalation(
+        "DS-1", QUESTION, "delete from orders", ROUTER_CONFIG.FAST_MODEL,
+        regenerate=lambda model: "select count(*) from orders",
+        execute=lambda query: executed.append(query) or [{"count": 3}]
+    )
+
+    assert result == ("select count(*) from orders", [{"count": 3}])
+    assert executed == ["select count(*) from orders"]
+
+
+def test_invalid_strong_sql_is_rejected():
+    with pytest.raises(ValueError, match="Invalid SQL"):
+        run_sql_with_escalation(
+            "DS-1", QUESTION, "select 1", ROUTER_CONFIG.FAST_MODEL,
+            regenerate=lambda model: "drop table orders",
+            execute=lambda query: (_ for _ in ()).throw(RuntimeError("syntax error"))
+        )
+
+
+@pytest.mark.parametrize("query, problem", [
+    ("", "empty query"),
+    ("explain select 1", "query must start with SELECT or WITH"),
+    ("with t as (select 1) delete from orders", "query must be read only"),
+    ("select 1; select 2", "query must be a single statement"),
+    ("select count(* from orders", "unbalanced parentheses"),
+])
+def test_validate_sql_rejections(query, problem):
+    assert model_router.validate_sql(query) == problem
+
+
+def test_validate_sql_accepts_read_only_queries():
+    assert model_router.validate_sql("WITH t AS (SELECT 1 AS a) SELECT a FROM t") is None
+
+
+def test_choose_model():
+    assert model_router.choose_model("intent", "DS-1", "rank the top agents by cumulative growth") == ROUTER_CONFIG.FAST_MODEL
+    assert model_router.choose_model("sql", "DS-1", "total valid sales") == ROUTER_CONFIG.FAST_MODEL
+    assert model_router.choose_model("sql", "DS-1", "bonus tier for each salesperson") == ROUTER_CONFIG.STRONG_MODEL
@@ -0,0 +1,37 @@
+import threading
+
+from helpers import speculation
+from helpers.speculation import SPECULATION_CONFIG, SpeculativeCall, speculation_stats
+
+
+def generate(question, usage=None):
+    usage["tokens"] = 10
+    return f"sql for {question}", threading.current_thread().name
+
+
+def test_take_waits_for_a_started_call():
+    call = SpeculativeCall(None, generate, "q1")
+    call.future.result()
+
+    sql, thread = call.take()
+    assert sql == "sql for q1"
+    assert thread.startswith("speculative-sql")
+
+
+def test_take_runs_queued_call_on_the_request_thread():
+    release = threading.Event()
+    # Occupy every worker so the speculative call stays queued
+    blockers = [speculation.executor.submit(release.wait) for _ in range(SPECULATION_CONFIG.MAX_WORKERS)]
+    inline_before = speculation_stats.inline
+    try:
+        call = SpeculativeCall(None, generate, "q2")
+        result = call.take()
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+
+    assert result == ("sql for q2", threading.current_thread().name)
+    assert call.future.cancelled()
+    assert call.usage == {"tokens": 10}
+    assert speculation_stats.inline == inline_before + 1
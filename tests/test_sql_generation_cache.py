@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import ds1
+from helpers.model_router import ROUTER_CONFIG
+from helpers.sql_cache import result_cache, sql_cache
+
+QUESTION = "What were total sales last month?"
+
+
+class FakeGemini:
+    def __init__(self):
+        self.calls = 0
+        self.models = self
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        return SimpleNamespace(text=f"```sql\nselect {self.calls} as attempt\n```", usage_metadata=None)
+
+
+class FakeSupabase:
+    def __init__(self, fail: bool):
+        self.fail = fail
+
+    def rpc(self, function, params):
+        if self.fail:
+            raise RuntimeError("column does not exist")
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[{"attempt": 1}]))
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(ds1, "gemini_client", fake)
+    monkeypatch.setattr(ds1.entity_index, "resolve", lambda question: (question, []))
+    sql_cache.clear()
+    result_cache.clear()
+    yield fake
+    sql_cache.clear()
+    result_cache.clear()
+
+
+def test_failed_sql_is_not_cached(monkeypatch, gemini):
+    monkeypatch.setattr(ds1, "supabase", FakeSupabase(fail=True))
+
+    sql_and_model = ds1.generate_sql_ds1(QUESTION, model=ROUTER_CONFIG.STRONG_MODEL)
+    with pytest.raises(RuntimeError):
+        ds1.execute_sql_ds1(QUESTION, sql_and_model)
+
+    # A retry generates new SQL instead of getting the broken query back
+    assert ds1.generate_sql_ds1(QUESTION)[0] == "select 2 as attempt"
+    assert gemini.calls == 2
+
+
+def test_sql_is_cached_after_it_runs(monkeypatch, gemini):
+    monkeypatch.setattr(ds1, "supabase", FakeSupabase(fail=False))
+
+    sql_and_model = ds1.generate_sql_ds1(QUESTION, model=ROUTER_CONFIG.STRONG_MODEL)
+    ds1.execute_sql_ds1(QUESTION, sql_and_model)
+
+    assert ds1.generate_sql_ds1(QUESTION)[:2] == ("select 1 as attempt", ROUTER_CONFIG.STRONG_MODEL)
+    assert gemini.calls == 1
@@ -0,0 +1,35 @@
+import pytest
+
+from helpers import warmup
+from helpers.warmup import WARMUP_CONFIG, warm_up
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    runs = []
+    monkeypatch.setattr(warmup, "last_report", None)
+    monkeypatch.setattr(warmup, "last_run_at", None)
+    monkeypatch.setattr(warmup, "_run_warm_up", lambda: runs.append(1) or {"success": True, "total_seconds": 0.1, "steps": []})
+    return runs
+
+
+def test_recent_warm_up_is_reused(runs):
+    first = warm_up()
+    second = warm_up()
+
+    assert len(runs) == 1
+    assert "reused" not in first
+    assert second == {**first, "reused": True}
+
+
+def test_forced_warm_up_always_runs(runs):
+    warm_up()
+    warm_up(force=True)
+    assert len(runs) == 2
+
+
+def test_warm_up_runs_again_after_interval(runs, monkeypatch):
+    monkeypatch.setattr(WARMUP_CONFIG, "MIN_INTERVAL_SECONDS", 0)
+    warm_up()
+    warm_up()
+    assert len(runs) == 2